@@ -0,0 +1,25 @@
+"""
+ASGI config for gettingstarted project.
+
+Serves the regular Django app plus the Server-Sent Events stream of
+game state changes at /events/<game id>/.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gettingstarted.settings")
+os.environ.setdefault("PSYKAHUT_EVENT_STREAM", "1")
+# Django 3.2 runs all sync views of an ASGI worker on one shared thread,
+# so a held poll would stall every other request. Clients falling back
+# from the event stream get plain polls instead.
+os.environ.setdefault("PSYKAHUT_LONG_POLL_TIMEOUT", "0")
+
+from django.core.asgi import get_asgi_application
+
+django_application = get_asgi_application()
+
+from psykahut.events import with_event_stream
+
+application = with_event_stream(django_application)
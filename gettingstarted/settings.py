@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 """
 
 import os
+import dj_database_url
 import django_heroku
+from django.core.exceptions import ImproperlyConfigured
 
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -43,6 +45,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'psykahut.middleware.QueryMetricsMiddleware',
+    'psykahut.profiling.ProfilingMiddleware',
+    'psykahut.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,9 +85,40 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # An in-memory test database can't take concurrent writers
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
     }
 }
 
+# Read replicas, as database URLs separated by spaces, e.g.
+# "sqlite:///replica.sqlite3" to try it out locally against a copy of
+# db.sqlite3. See psykahut/routers.py.
+PSYKAHUT_REPLICAS = []
+for i, url in enumerate(os.environ.get('PSYKAHUT_REPLICA_URLS', '').split()):
+    DATABASES[f'replica{i}'] = dict(
+        dj_database_url.parse(url), TEST={'MIRROR': 'default'})
+    PSYKAHUT_REPLICAS.append(f'replica{i}')
+DATABASE_ROUTERS = ['psykahut.routers.ReplicaRouter']
+# How long after a write a client keeps reading from the primary (seconds).
+PSYKAHUT_REPLICA_PIN = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Round snapshots are shared through it, so with several worker
+# processes point it at memcached.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if 'MEMCACHED_LOCATION' in os.environ:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': os.environ['MEMCACHED_LOCATION'],
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
@@ -122,4 +158,82 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+
+# Psykahut
+
+# How long /api/cur_question/ holds a poll whose ETag is still current
+# (seconds). 0 answers at once; gettingstarted/asgi.py sets that.
+PSYKAHUT_LONG_POLL_TIMEOUT = int(
+    os.environ.get('PSYKAHUT_LONG_POLL_TIMEOUT', 20))
+# Held polls also re-check the database this often, to notice writes
+# made by other worker processes (seconds).
+PSYKAHUT_LONG_POLL_RECHECK = 2
+# Polls held at once per process. Keep below gunicorn's --threads so
+# that other requests still get a thread.
+PSYKAHUT_LONG_POLL_MAX_WAITERS = 24
+# How long cached round snapshots live (seconds). Each state version has
+# its own, so this only bounds how long superseded ones take up space.
+PSYKAHUT_SNAPSHOT_TTL = 600
+# How long to wait for another process building the same snapshot
+# before building it anyway (seconds).
+PSYKAHUT_SNAPSHOT_BUILD_TIMEOUT = 2
+# How stale the spectator view may be (seconds). Spectators check for
+# changes this often, and the game's version is re-read this often.
+PSYKAHUT_SPECTATOR_REFRESH = 1
+# How long a player's signed cookie identifies them (seconds). Players
+# are identified by it alone, so that requests don't read the session.
+PSYKAHUT_PLAYER_TOKEN_AGE = 7 * 24 * 60 * 60
+# Whether votes are recorded in the cache and written in batches (see
+# psykahut/votes.py). Needs a cache shared by all processes.
+PSYKAHUT_VOTE_BUFFER = os.environ.get('PSYKAHUT_VOTE_BUFFER') == '1'
+if PSYKAHUT_VOTE_BUFFER and CACHES['default']['BACKEND'].endswith(
+        ('.LocMemCache', '.DummyCache')):
+    # Each process would only see its own ballots, losing the others'
+    raise ImproperlyConfigured(
+        'PSYKAHUT_VOTE_BUFFER needs a cache shared by all processes, '
+        'e.g. memcached through MEMCACHED_LOCATION')
+# Buffered votes are written every this many votes, and when rounds close.
+PSYKAHUT_VOTE_FLUSH_SIZE = 50
+# How long the cache keeps a round's buffered votes (seconds).
+PSYKAHUT_VOTE_BUFFER_TTL = 6 * 60 * 60
+# How many top scores leaderboards keep.
+PSYKAHUT_LEADERBOARD_SIZE = 10
+# How long games keep their answers, votes and players before
+# manage.py compact_games archives them, once finished or as idle
+# (seconds).
+PSYKAHUT_GAME_RETENTION = 7 * 24 * 60 * 60
+# Retry-After sent instead of holding when the process is at capacity (seconds).
+PSYKAHUT_POLL_BACKOFF = 5
+# Retry-After sent when polls aren't held at all (PSYKAHUT_LONG_POLL_TIMEOUT
+# is 0), so that clients don't poll in a tight loop (seconds).
+PSYKAHUT_POLL_INTERVAL = 2
+
+# Whether pages subscribe to /events/<game id>/. Only the ASGI entry
+# point (gettingstarted.asgi) serves it, and it turns this on.
+PSYKAHUT_EVENT_STREAM = os.environ.get('PSYKAHUT_EVENT_STREAM') == '1'
+# Relays published events to the event streams. InProcessBroker only
+# reaches streams served by the same process; with several workers use
+# 'psykahut.events.RedisBroker' with {'url': os.environ['REDIS_URL']}.
+PSYKAHUT_EVENT_BROKER = 'psykahut.events.InProcessBroker'
+PSYKAHUT_EVENT_BROKER_OPTIONS = {}
+# Comment sent on idle streams so proxies don't drop them (seconds).
+PSYKAHUT_EVENT_STREAM_KEEPALIVE = 15
+# How long browsers wait before reconnecting a dropped stream (seconds).
+PSYKAHUT_EVENT_STREAM_RETRY = 3
+
+# Fraction of requests to profile (see psykahut/profiling.py), e.g. 0.001.
+PSYKAHUT_PROFILE_RATE = float(os.environ.get('PSYKAHUT_PROFILE_RATE', 0))
+# Requests slower than this are saved too (milliseconds), or None.
+PSYKAHUT_PROFILE_SLOW = (
+    float(os.environ['PSYKAHUT_PROFILE_SLOW'])
+    if 'PSYKAHUT_PROFILE_SLOW' in os.environ else None)
+# How many requests of a view to profile after one of it ran slow.
+PSYKAHUT_PROFILE_AFTER_SLOW = 5
+# Where profiles are saved, and how many are kept per view.
+PSYKAHUT_PROFILE_DIR = os.environ.get(
+    'PSYKAHUT_PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+PSYKAHUT_PROFILE_KEEP = 200
+# Views never profiled. Long polls are slow by design.
+PSYKAHUT_PROFILE_IGNORE = ['psykahut.views.cur_question_id']
+
 django_heroku.settings(locals())
\ No newline at end of file
@@ -6,14 +6,23 @@ admin.autodiscover()
 
 import psykahut.views
 
+# Join codes are upper case, so they can't clash with the other paths
+room = r'^(?P<code>[A-Z0-9]+)/'
+
 urlpatterns = [
-    url(r'^$', psykahut.views.index),
+    url(r'^$', psykahut.views.welcome),
     url(r'^manage/$', psykahut.views.manage),
     url(r'^manage/start_new/$', psykahut.views.start_new),
-    url(r'^manage/next/$', psykahut.views.next_question),
     url(r'^register/$', psykahut.views.register),
-    url(r'^open_question/$', psykahut.views.open_question),
-    url(r'^quiz/$', psykahut.views.answer_quiz),
-    url(r'^api/cur_question/$', psykahut.views.cur_question_id),
+    url(r'^leaderboard/$', psykahut.views.leaderboard),
+    url(r'^leaderboard/(?P<topic_id>\d+)/$', psykahut.views.leaderboard),
+    url(r'^archive/(?P<code>[A-Z0-9]+)/$', psykahut.views.archived_game),
+    url(room + r'$', psykahut.views.index),
+    url(room + r'manage/$', psykahut.views.manage),
+    url(room + r'manage/next/$', psykahut.views.next_question),
+    url(room + r'spectate/$', psykahut.views.spectate),
+    url(room + r'open_question/$', psykahut.views.open_question),
+    url(room + r'quiz/$', psykahut.views.answer_quiz),
+    url(room + r'api/cur_question/$', psykahut.views.cur_question_id),
     path('admin/', admin.site.urls),
 ]
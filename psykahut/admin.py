@@ -1,10 +1,164 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
 
 from .models import *
 
+class EstimatedCountPaginator(Paginator):
+    '''
+    Unfiltered changelists of big Postgres tables use the planner's row
+    estimate rather than counting every row.
+    '''
+    estimate_above = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > self.estimate_above:
+                return int(row[0])
+        return super().count
+
+class RecentGameFilter(admin.SimpleListFilter):
+    '''By game, offering the latest games. Uses the (game, ...) indexes.'''
+    title = 'game'
+    parameter_name = 'game'
+
+    def lookups(self, request, model_admin):
+        return [
+            (game_id, f'{code} ({started:%Y-%m-%d %H:%M})')
+            for game_id, code, started in Game.objects.order_by(
+                '-id').values_list('id', 'code', 'started')[:20]]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(game_id=self.value())
+
+class GameQuestionFilter(admin.SimpleListFilter):
+    '''By question, offering those of the game filtered by.'''
+    title = 'question'
+    parameter_name = 'question'
+
+    def lookups(self, request, model_admin):
+        game_id = request.GET.get(RecentGameFilter.parameter_name)
+        if not game_id:
+            return []
+        return DeckEntry.objects.filter(game_id=game_id).order_by(
+            'position').values_list('question_id', 'question__question_text')
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(question_id=self.value())
+
+class HistoryAdmin(admin.ModelAdmin):
+    '''For tables that grow with every game played.'''
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_filter = [RecentGameFilter]
+
+    @admin.display(description='game', ordering='game__code')
+    def game_code(self, obj):
+        return obj.game.code
+
+@admin.register(Answer)
+class AnswerAdmin(HistoryAdmin):
+    list_display = [
+        'id', 'text', 'author_name', 'question_text', 'game_code',
+        'permutation_order']
+    list_select_related = ['author', 'question', 'game']
+    list_filter = [RecentGameFilter, GameQuestionFilter]
+    raw_id_fields = ['question', 'author', 'game']
+
+    @admin.display(description='author')
+    def author_name(self, obj):
+        return obj.author.name
+
+    @admin.display(description='question')
+    def question_text(self, obj):
+        return obj.question.question_text
+
+@admin.register(Vote)
+class VoteAdmin(HistoryAdmin):
+    list_display = [
+        'id', 'voter_name', 'answer_text', 'question_text', 'game_code']
+    list_select_related = ['voter', 'answer', 'question', 'game']
+    list_filter = [RecentGameFilter, GameQuestionFilter]
+    raw_id_fields = ['voter', 'question', 'answer', 'game']
+
+    @admin.display(description='voter')
+    def voter_name(self, obj):
+        return obj.voter.name
+
+    @admin.display(description='answer')
+    def answer_text(self, obj):
+        return obj.answer.text if obj.answer else obj.question.answer_text
+
+    @admin.display(description='question')
+    def question_text(self, obj):
+        return obj.question.question_text
+
+@admin.register(Player)
+class PlayerAdmin(HistoryAdmin):
+    list_display = ['id', 'name', 'score', 'game_code']
+    list_select_related = ['game']
+    raw_id_fields = ['game']
+
+@admin.register(Game)
+class GameAdmin(admin.ModelAdmin):
+    list_display = [
+        'code', 'started', 'topic', 'phase', 'questions_asked_count']
+    list_select_related = ['topic']
+    raw_id_fields = ['current', 'prev']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+@admin.register(Question)
+class QuestionAdmin(admin.ModelAdmin):
+    list_display = ['question_text', 'answer_text', 'topic']
+    list_select_related = ['topic']
+    list_filter = ['topic']
+    paginator = EstimatedCountPaginator
+
+@admin.register(QuestionStats)
+class QuestionStatsAdmin(admin.ModelAdmin):
+    list_display = [
+        'question_text', 'topic', 'rounds', 'real_votes', 'fake_votes',
+        'fake_answers', 'fooled']
+    list_select_related = ['question__topic']
+    list_filter = ['question__topic']
+    ordering = ['-fake_votes']
+    paginator = EstimatedCountPaginator
+    raw_id_fields = ['question']
+
+    @admin.display(description='question', ordering='question__question_text')
+    def question_text(self, obj):
+        return obj.question.question_text
+
+    @admin.display(description='topic')
+    def topic(self, obj):
+        return obj.question.topic.name
+
+    @admin.display(description='fooled')
+    def fooled(self, obj):
+        return f'{obj.fooled_rate:.0%}'
+
+@admin.register(ArchivedGame)
+class ArchivedGameAdmin(admin.ModelAdmin):
+    list_display = ['code', 'topic', 'started', 'archived']
+    search_fields = ['code']
+    paginator = EstimatedCountPaginator
+
+@admin.register(GameEvent)
+class GameEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'time', 'game', 'kind']
+    list_filter = ['kind']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
 admin.site.register(Topic)
-admin.site.register(Question)
-admin.site.register(Game)
-admin.site.register(Player)
-admin.site.register(Answer)
-admin.site.register(Vote)
@@ -0,0 +1,65 @@
+"""Compacting finished games.
+
+A game's answers, votes and players are only needed while it's played.
+Past the retention window `archive_game` rolls it up into an
+`ArchivedGame` and deletes its rows, so that the tables the game views
+query only hold recent games.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from . import leaderboards, models, state, summaries
+
+def expired_games(retention=None):
+    '''
+    Ids of the games started longer than `retention` (seconds) ago that
+    have finished, or haven't been played for as long.
+    '''
+    if retention is None:
+        retention = settings.PSYKAHUT_GAME_RETENTION
+    cutoff = timezone.now() - datetime.timedelta(seconds=retention)
+    recent = models.GameEvent.objects.filter(
+        game=OuterRef('id'), time__gte=cutoff)
+    return models.Game.objects.filter(
+        Q(current=None) | ~Exists(recent), started__lt=cutoff,
+        ).order_by('id').values_list('id', flat=True)
+
+def archive_game(game_id):
+    '''Roll the game up into an ArchivedGame and delete it and its rows.'''
+    with transaction.atomic():
+        game = models.Game.objects.select_for_update().select_related(
+            'topic').get(id=game_id)
+        stored = dict(models.RoundSummary.objects.filter(
+            game=game).values_list('question_id', 'data'))
+        rounds = []
+        for question in models.Question.objects.filter(
+                deckentry__game=game,
+                deckentry__position__lt=game.questions_asked_count,
+                ).order_by('deckentry__position'):
+            if question.id not in stored:
+                # Round closed before summaries were stored
+                stored[question.id] = summaries.build_summary(game, question)
+            rounds.append(stored[question.id])
+        archived = models.ArchivedGame.objects.create(
+            code=game.code,
+            topic=game.topic.name,
+            started=game.started,
+            data={
+                'scores': list(models.Player.objects.filter(
+                    game=game).order_by('-score', 'name').values(
+                    'name', 'score')),
+                'rounds': rounds,
+            })
+        # Delete the biggest tables first, so that cascading from the
+        # game doesn't need to collect their rows
+        models.Vote.objects.filter(game=game).delete()
+        models.Answer.objects.filter(game=game).delete()
+        models.Leaderboard.objects.filter(
+            scope=leaderboards.game_scope(game.id)).delete()
+        game.delete()
+        state.forget_code(game.code)
+    return archived
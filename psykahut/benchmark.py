@@ -0,0 +1,134 @@
+"""Helpers for driving the app with simulated clients and timing it."""
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve
+
+@contextlib.contextmanager
+def scratch_database():
+    '''
+    Run against a freshly created database, named after the test
+    database in settings.DATABASES and this process, so that benchmarks
+    never touch real games, each other's or the test suite's database.
+    Replicas are switched off, as they'd still serve the real database.
+    '''
+    old_name = connection.settings_dict['NAME']
+    test = connection.settings_dict['TEST']
+    test_name = test.get('NAME')
+    # An in-memory SQLite test database is already private
+    if test_name or connection.vendor != 'sqlite':
+        root, ext = os.path.splitext(test_name or f'test_{old_name}')
+        test['NAME'] = f'{root}_scratch{os.getpid()}{ext}'
+    try:
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(PSYKAHUT_REPLICAS=[]):
+                yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    finally:
+        test['NAME'] = test_name
+
+def percentile(values, pct):
+    '''Nearest-rank percentile of sorted `values`.'''
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+class Recorder:
+    '''
+    Performs requests through Django test clients and records the
+    latency and number of queries of each, by view.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def client(self):
+        return Client(HTTP_HOST='localhost')
+
+    def request(self, client, method, path, data=None, **extra):
+        endpoint = resolve(path.split('?')[0]).func.__name__
+        start = time.perf_counter()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(client, method)(path, data, **extra)
+        except Exception:
+            response = None
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            if response is None or response.status_code >= 500:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            else:
+                self.samples.setdefault(endpoint, []).append(
+                    (elapsed, len(queries)))
+        return response
+
+    def report(self):
+        endpoints = {}
+        for endpoint in sorted(set(self.samples) | set(self.errors)):
+            samples = self.samples.get(endpoint, [])
+            latencies = sorted(x for x, _ in samples)
+            queries = [x for _, x in samples]
+            endpoints[endpoint] = {
+                'count': len(samples),
+                'errors': self.errors.get(endpoint, 0),
+                'p50_ms': _ms(percentile(latencies, 50)),
+                'p95_ms': _ms(percentile(latencies, 95)),
+                'p99_ms': _ms(percentile(latencies, 99)),
+                'mean_queries': queries and round(sum(queries) / len(queries), 2),
+                'max_queries': max(queries, default=None),
+            }
+        return endpoints
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+def write_report(report, path, stderr):
+    '''
+    Write `report` as JSON to `path`, or stdout if None, and summarize
+    its runs on `stderr` (a management command's).
+    '''
+    if path:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    for run in report['runs']:
+        stderr.write(f"{run['name']}: {run['throughput_rps']} requests/s")
+        for endpoint, stats in run['endpoints'].items():
+            stderr.write(
+                f"  {endpoint:16} p50 {stats['p50_ms']}ms "
+                f"p95 {stats['p95_ms']}ms p99 {stats['p99_ms']}ms "
+                f"{stats['mean_queries']} queries "
+                f"{stats['errors']} errors")
+
+def run_report(name, recorder, elapsed):
+    endpoints = recorder.report()
+    requests = sum(x['count'] + x['errors'] for x in endpoints.values())
+    return {
+        'name': name,
+        'requests': requests,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(requests / elapsed, 1),
+        'endpoints': endpoints,
+    }
+
+def close_connections(pool, num_threads):
+    '''Have each of `pool`\'s worker threads close its database connection.'''
+    # The barrier keeps any thread from taking two of these
+    barrier = threading.Barrier(num_threads)
+    def close(_):
+        connection.close()
+        barrier.wait()
+    list(pool.map(close, range(num_threads)))
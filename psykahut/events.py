@@ -0,0 +1,177 @@
+"""Game state events, pushed to players over Server-Sent Events.
+
+Write views publish an event per game once their transaction commits.
+`stream` is a plain ASGI app serving ``/events/<game id>/`` that relays
+them, so an idle player costs an open socket rather than a poll.
+
+The broker is chosen by the ``PSYKAHUT_EVENT_BROKER`` setting.
+`InProcessBroker` only reaches subscribers in the same process; use
+`RedisBroker` when running more than one worker.
+"""
+import asyncio
+import functools
+import json
+import re
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from . import models
+
+class InProcessBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    def subscribe(self, channel):
+        return _InProcessSubscription(self, channel)
+
+class _InProcessSubscription:
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+
+    async def __aenter__(self):
+        self.queue = asyncio.Queue()
+        self.entry = (asyncio.get_running_loop(), self.queue)
+        with self.broker._lock:
+            self.broker._subscribers.setdefault(
+                self.channel, set()).add(self.entry)
+        return self
+
+    async def __aexit__(self, *exc):
+        with self.broker._lock:
+            subscribers = self.broker._subscribers[self.channel]
+            subscribers.discard(self.entry)
+            if not subscribers:
+                del self.broker._subscribers[self.channel]
+
+    async def get(self):
+        return await self.queue.get()
+
+class RedisBroker:
+    def __init__(self, url='redis://localhost:6379/0', prefix='psykahut:'):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise ImproperlyConfigured('RedisBroker requires the redis package')
+        self.url = url
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        self.async_client = redis.asyncio.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self.client.publish(self.prefix + str(channel), message)
+
+    def subscribe(self, channel):
+        return _RedisSubscription(self, self.prefix + str(channel))
+
+class _RedisSubscription:
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+
+    async def __aenter__(self):
+        self.pubsub = self.broker.async_client.pubsub()
+        await self.pubsub.subscribe(self.channel)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.pubsub.unsubscribe(self.channel)
+        await self.pubsub.close()
+
+    async def get(self):
+        while True:
+            message = await self.pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=None)
+            if message is not None:
+                return message['data'].decode()
+
+@functools.lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.PSYKAHUT_EVENT_BROKER)(
+        **settings.PSYKAHUT_EVENT_BROKER_OPTIONS)
+
+def publish(game, event, is_quiz=False):
+    '''Tell `game`'s players its new state, once the current transaction commits.'''
+    message = json.dumps({
+        'event': event,
+        'game': game.id,
+        'cur': game.current_id,
+        'is_quiz': is_quiz,
+    })
+    transaction.on_commit(lambda: get_broker().publish(game.id, message))
+
+def initial_message(game_id):
+    game = models.Game.objects.filter(id=game_id).first()
+    if game is None:
+        return 'null'
+    return json.dumps({
+        'event': 'state',
+        'game': game.id,
+        'cur': game.current_id,
+        'is_quiz': game.phase == models.Game.QUIZ,
+    })
+
+path_re = re.compile(r'^/events/(\d+)/$')
+
+async def stream(scope, receive, send):
+    game_id = int(path_re.match(scope['path']).group(1))
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+    async def write(data):
+        await send({
+            'type': 'http.response.body',
+            'body': data.encode(),
+            'more_body': True,
+        })
+    disconnected = asyncio.ensure_future(_disconnect(receive))
+    try:
+        async with get_broker().subscribe(game_id) as subscription:
+            await write('retry: %d\ndata: %s\n\n' % (
+                settings.PSYKAHUT_EVENT_STREAM_RETRY * 1000,
+                await sync_to_async(initial_message)(game_id)))
+            while not disconnected.done():
+                message = asyncio.ensure_future(subscription.get())
+                await asyncio.wait(
+                    {message, disconnected},
+                    timeout=settings.PSYKAHUT_EVENT_STREAM_KEEPALIVE,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if message.done():
+                    await write('data: %s\n\n' % message.result())
+                else:
+                    message.cancel()
+                    if not disconnected.done():
+                        await write(': keepalive\n\n')
+    finally:
+        disconnected.cancel()
+
+async def _disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+def with_event_stream(application):
+    '''Wrap an ASGI application to serve `stream` at /events/<game id>/.'''
+    async def app(scope, receive, send):
+        if scope['type'] == 'http' and path_re.match(scope['path']):
+            return await stream(scope, receive, send)
+        return await application(scope, receive, send)
+    return app
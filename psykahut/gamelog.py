@@ -0,0 +1,30 @@
+"""An append-only log of the writes to each game.
+
+Every view that changes a game records a `GameEvent` of what it did,
+naming players, answers and questions by their ids. Along with the
+questions, that's enough for the replay_game command to play the game
+again against another database, at its recorded pace or faster.
+"""
+from . import models
+
+START = 'start'
+REGISTER = 'register'
+ANSWER = 'answer'
+VOTE = 'vote'
+NEXT = 'next'
+
+def record(game_id, kind, **data):
+    '''Append an event, as part of the current transaction.'''
+    models.GameEvent.objects.create(game=game_id, kind=kind, data=data)
+
+def vote(game_id, player_id, author_id, time=None):
+    '''
+    An unsaved event of a vote for the answer by `author_id`, or for the
+    real answer if it's None. Unsaved so that votes can be recorded in bulk.
+    '''
+    event = models.GameEvent(
+        game=game_id, kind=VOTE,
+        data={'player': player_id, 'author': author_id})
+    if time is not None:
+        event.time = time
+    return event
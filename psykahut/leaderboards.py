@@ -0,0 +1,78 @@
+"""Leaderboards for a game, its topic and all time.
+
+Rather than summing every player's score when shown, totals are kept
+per name in `LeaderboardEntry` and updated from each closed round's
+score deltas. Each board's top scores are then read off an index and
+stored in its `Leaderboard` row, so showing one is a single row fetch.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from . import models
+
+ALL_TIME = 'all'
+
+def game_scope(game_id):
+    return f'game:{game_id}'
+
+def topic_scope(topic_id):
+    return f'topic:{topic_id}'
+
+def top(scope):
+    '''The scope's top scores, best first.'''
+    return models.Leaderboard.objects.filter(scope=scope).values_list(
+        'top', flat=True).first() or []
+
+def record(game, deltas):
+    '''
+    Refresh the game's top scores after a closed round's score deltas
+    ({player id: delta}, as applied to the players by views.score_votes),
+    in the same transaction as applying them. Returns them.
+
+    The topic and all-time totals are shared by every room, so they're
+    updated in a short transaction of their own once this one commits,
+    rather than holding their rows locked until it does.
+    '''
+    scope = game_scope(game.id)
+    models.Leaderboard.objects.bulk_create(
+        [models.Leaderboard(scope=scope)], ignore_conflicts=True)
+    scores = list(models.Player.objects.filter(game=game).order_by(
+        '-score', 'name').values('name', 'score')[
+        :settings.PSYKAHUT_LEADERBOARD_SIZE])
+    models.Leaderboard.objects.filter(scope=scope).update(top=scores)
+    by_name = {
+        name: deltas[player_id]
+        for player_id, name in models.Player.objects.filter(
+            id__in=deltas).values_list('id', 'name')}
+    transaction.on_commit(lambda: add_totals(game.topic_id, by_name))
+    return scores
+
+def add_totals(topic_id, deltas):
+    '''Add score deltas ({name: delta}) to the topic and all-time totals.'''
+    scopes = [topic_scope(topic_id), ALL_TIME]
+    with transaction.atomic():
+        models.Leaderboard.objects.bulk_create(
+            [models.Leaderboard(scope=x) for x in scopes],
+            ignore_conflicts=True)
+        boards = dict(models.Leaderboard.objects.filter(
+            scope__in=scopes).values_list('scope', 'id'))
+        if deltas:
+            models.LeaderboardEntry.objects.bulk_create([
+                models.LeaderboardEntry(leaderboard_id=board, name=name)
+                for board in boards.values() for name in deltas],
+                ignore_conflicts=True)
+            by_delta = {}
+            for name, delta in deltas.items():
+                by_delta.setdefault(delta, []).append(name)
+            models.LeaderboardEntry.objects.filter(
+                leaderboard_id__in=boards.values(), name__in=deltas,
+                ).update(score=F('score') + Case(
+                    *[When(name__in=x, then=Value(delta))
+                      for delta, x in by_delta.items()],
+                    default=Value(0)))
+        for board in boards.values():
+            models.Leaderboard.objects.filter(id=board).update(
+                top=list(models.LeaderboardEntry.objects.filter(
+                    leaderboard_id=board).order_by('-score', 'name').values(
+                    'name', 'score')[:settings.PSYKAHUT_LEADERBOARD_SIZE]))
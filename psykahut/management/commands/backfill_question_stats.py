@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from psykahut import stats
+
+class Command(BaseCommand):
+    help = (
+        'Recompute per-question stats from the rounds closed so far, '
+        'including those of archived games. Run while no rounds are '
+        'closing, as they add to the same stats.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, **options):
+        num_questions = 0
+        for done in stats.backfill(options['batch_size']):
+            num_questions += done
+            self.stderr.write(f'{num_questions} questions')
+        num_games = 0
+        for done in stats.backfill_archived(options['batch_size']):
+            num_games += done
+            self.stderr.write(f'{num_games} archived games')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from psykahut import archive
+
+class Command(BaseCommand):
+    help = (
+        'Archive finished or idle games older than the retention window '
+        '(PSYKAHUT_GAME_RETENTION) and delete their answers, votes and '
+        'players.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=float,
+            help='Retention window in days, instead of the setting')
+
+    def handle(self, **options):
+        retention = options['days'] and options['days'] * 24 * 60 * 60
+        num_archived = 0
+        for game_id in list(archive.expired_games(retention)):
+            archive.archive_game(game_id)
+            num_archived += 1
+        self.stderr.write(f'{num_archived} games archived')
@@ -0,0 +1,26 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from psykahut import question_bank
+
+class Command(BaseCommand):
+    help = (
+        'Write questions as CSV or JSON lines with the fields topic, '
+        'question_text and answer_text.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--topic', action='append', help="Only this topic's questions")
+        parser.add_argument('--format', choices=question_bank.FORMATS)
+        parser.add_argument('--output', help='File to write instead of stdout')
+
+    def handle(self, **options):
+        path = options['output']
+        fmt = options['format'] or question_bank.guess_format(path or '')
+        rows = question_bank.export_rows(options['topic'])
+        if path is None:
+            question_bank.write_rows(sys.stdout, fmt, rows)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                question_bank.write_rows(f, fmt, rows)
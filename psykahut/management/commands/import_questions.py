@@ -0,0 +1,46 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from psykahut import question_bank
+
+class Command(BaseCommand):
+    help = (
+        'Add questions from a CSV or JSON lines file with the fields '
+        'topic, question_text and answer_text. Questions already in their '
+        'topic are skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or - for stdin")
+        parser.add_argument('--format', choices=question_bank.FORMATS)
+        parser.add_argument(
+            '--topic', help="Add all questions to this topic instead")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, path, **options):
+        fmt = options['format'] or question_bank.guess_format(path)
+        if path == '-':
+            self.load(sys.stdin, fmt, options)
+        else:
+            with open(path, newline='', encoding='utf-8') as f:
+                self.load(f, fmt, options)
+
+    def load(self, f, fmt, options):
+        start = time.perf_counter()
+        num_rows = num_added = 0
+        batches = question_bank.import_rows(
+            question_bank.read_rows(f, fmt), options['batch_size'],
+            topic=options['topic'])
+        for i, (read, added) in enumerate(batches, 1):
+            num_rows += read
+            num_added += added
+            if i % 20 == 0:
+                self.report(num_rows, num_added, start)
+        self.report(num_rows, num_added, start)
+
+    def report(self, num_rows, num_added, start):
+        elapsed = time.perf_counter() - start
+        self.stderr.write(
+            f'{num_rows} rows, {num_added} questions added, '
+            f'{num_rows / elapsed if elapsed else 0:.0f} rows/s')
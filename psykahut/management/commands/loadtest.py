@@ -0,0 +1,112 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from psykahut import models
+from psykahut.benchmark import (
+    Recorder, close_connections, run_report, scratch_database, write_report)
+
+class Command(BaseCommand):
+    help = (
+        'Play games with simulated players against a scratch database and '
+        'report latency and queries per endpoint, and throughput.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=50)
+        parser.add_argument('--rounds', type=int, default=3)
+        parser.add_argument(
+            '--answers', type=int, default=4,
+            help='Psych answers per question')
+        parser.add_argument(
+            '--polls', type=int, default=2,
+            help='Polls of /api/cur_question/ per player per phase')
+        parser.add_argument(
+            '--concurrency', default='1,8,32',
+            help='Comma separated numbers of simultaneous clients; '
+            'a full game is played at each')
+        parser.add_argument(
+            '--output', help='Write the JSON report to this file')
+
+    def handle(self, **options):
+        if options['answers'] > options['players']:
+            options['answers'] = options['players']
+        levels = [int(x) for x in options['concurrency'].split(',')]
+        # Polls shouldn't be held open, or they'd measure the timeout
+        with scratch_database(), override_settings(
+                PSYKAHUT_LONG_POLL_TIMEOUT=0):
+            runs = [self.play(concurrency, options) for concurrency in levels]
+        write_report({
+            'vendor': connection.vendor,
+            'players': options['players'],
+            'rounds': options['rounds'],
+            'answers': options['answers'],
+            'runs': runs,
+            'ceiling_rps': max(x['throughput_rps'] for x in runs),
+        }, options['output'], self.stderr)
+
+    def play(self, concurrency, options):
+        recorder = Recorder()
+        topic = models.Topic.objects.create(
+            name=f'loadtest {concurrency} {random.random()}')
+        models.Question.objects.bulk_create([
+            models.Question(
+                topic=topic, question_text=f'question {i}',
+                answer_text=f'answer {i}')
+            for i in range(options['rounds'])])
+        host = recorder.client()
+        code = recorder.request(host, 'post', '/manage/start_new/', {
+            'topic': topic.name,
+            'num_answers': options['answers'],
+            'shuffle': 'on',
+        }).url.split('/')[1]
+        players = [recorder.client() for _ in range(options['players'])]
+        etags = {}
+
+        def poll(i):
+            for _ in range(options['polls']):
+                extra = {}
+                if i in etags:
+                    extra['HTTP_IF_NONE_MATCH'] = etags[i]
+                response = recorder.request(
+                    players[i], 'get', f'/{code}/api/cur_question/', **extra)
+                if response is not None and response.has_header('ETag'):
+                    etags[i] = response['ETag']
+
+        def register(i):
+            recorder.request(players[i], 'post', '/register/', {
+                'code': code, 'name': f'player {i}'})
+
+        def answer(i):
+            poll(i)
+            recorder.request(players[i], 'get', f'/{code}/')
+            recorder.request(
+                players[i], 'post', f'/{code}/open_question/',
+                {'answer': f'fake {i} {random.random()}'})
+
+        def vote(i):
+            poll(i)
+            recorder.request(players[i], 'get', f'/{code}/')
+            recorder.request(players[i], 'post', f'/{code}/quiz/', {
+                'answer': random.randrange(options['answers'] + 1)})
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            def run_all(step):
+                list(pool.map(step, range(len(players))))
+            run_all(register)
+            for round_num in range(options['rounds']):
+                run_all(answer)
+                run_all(vote)
+                recorder.request(host, 'get', f'/{code}/manage/')
+                recorder.request(
+                    host, 'post', f'/{code}/manage/next/', {'round': round_num})
+            close_connections(pool, concurrency)
+        return dict(
+            run_report(
+                f'concurrency {concurrency}', recorder,
+                time.perf_counter() - start),
+            concurrency=concurrency)
@@ -0,0 +1,58 @@
+import io
+import pstats
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+
+from psykahut import profiling
+
+class Command(BaseCommand):
+    help = (
+        'Sum up the requests saved by the profiling middleware: the top '
+        'functions and queries per view.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--view', help='Only this view, e.g. psykahut.views.index')
+        parser.add_argument(
+            '--top', type=int, default=15,
+            help='Functions and queries to show per view')
+        parser.add_argument(
+            '--sort', default='cumulative', choices=['cumulative', 'tottime'],
+            help='Order functions by time including or excluding their callees')
+
+    def handle(self, view=None, **options):
+        saved = profiling.load(view)
+        if not saved:
+            raise CommandError('No saved profiles')
+        for view, requests in saved.items():
+            self.report(view, requests, options['top'], options['sort'])
+
+    def report(self, view, requests, top, sort):
+        times = sorted(info['total_ms'] for info, _ in requests)
+        profiles = [prof for _, prof in requests if prof]
+        self.stdout.write(
+            f'== {view}: {len(requests)} requests '
+            f'({len(profiles)} profiled, '
+            f'{sum(info["slow"] for info, _ in requests)} slow), '
+            f'median {statistics.median(times):.1f}ms, max {times[-1]:.1f}ms, '
+            f'{statistics.mean(x["num_queries"] for x, _ in requests):.1f} '
+            'queries on average')
+        if profiles:
+            out = io.StringIO()
+            stats = pstats.Stats(*profiles, stream=out)
+            stats.sort_stats(sort).print_stats(top)
+            text = out.getvalue()
+            # Skip the header listing every file
+            self.stdout.write(text[max(text.find('   ncalls'), 0):])
+        queries = {}
+        for info, _ in requests:
+            for sql, ms in info['queries']:
+                sql = profiling.normalize_sql(sql)
+                count, total = queries.get(sql, (0, 0))
+                queries[sql] = count + 1, total + ms
+        self.stdout.write('  count   total ms  query')
+        for sql, (count, total) in sorted(
+                queries.items(), key=lambda x: -x[1][1])[:top]:
+            self.stdout.write(f'{count:7d} {total:10.1f}  {sql}')
+        self.stdout.write('')
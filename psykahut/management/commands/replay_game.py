@@ -0,0 +1,178 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from psykahut import gamelog, models
+from psykahut.benchmark import (
+    Recorder, close_connections, run_report, scratch_database, write_report)
+
+class Command(BaseCommand):
+    help = (
+        'Play recorded games again against a scratch database, from their '
+        'event log, and report latency and queries per endpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'games', nargs='+', help='Ids or join codes of recorded games')
+        parser.add_argument(
+            '--speed', type=float, default=1,
+            help='Multiple of the recorded pace. 0 replays events one at '
+            'a time, as fast as possible')
+        parser.add_argument(
+            '--concurrency', type=int, default=32,
+            help='Most requests in flight at once')
+        parser.add_argument(
+            '--output', help='Write the JSON report to this file')
+
+    def handle(self, games, **options):
+        events = list(models.GameEvent.objects.filter(
+            game__in=[self.game_id(x) for x in games]).order_by('time', 'id'))
+        if not events:
+            raise CommandError('No events recorded for these games')
+        # Read before switching to the scratch database
+        questions = deck_questions(events)
+        with scratch_database(), override_settings(
+                PSYKAHUT_LONG_POLL_TIMEOUT=0):
+            replay = Replay(events, questions)
+            start = time.perf_counter()
+            if options['speed']:
+                replay.run(options['speed'], options['concurrency'])
+            else:
+                for event in events:
+                    replay.apply(event)
+            run = run_report(
+                f"speed {options['speed'] or 'max'}", replay.recorder,
+                time.perf_counter() - start)
+        write_report({
+            'vendor': connection.vendor,
+            'games': games,
+            'events': len(events),
+            'recorded_seconds': round(
+                (events[-1].time - events[0].time).total_seconds(), 3),
+            'runs': [run],
+        }, options['output'], self.stderr)
+
+    def game_id(self, game):
+        if game.isdigit():
+            return int(game)
+        found = models.GameEvent.objects.filter(
+            kind=gamelog.START, data__code=game.upper()).values_list(
+            'game', flat=True).first()
+        if found is None:
+            raise CommandError(f'No recorded game {game}')
+        return found
+
+def deck_questions(events):
+    '''{id: (text, answer)} of the questions dealt in the START `events`.'''
+    ids = {
+        question for event in events if event.kind == gamelog.START
+        for question in event.data['deck']}
+    questions = {
+        question: (text, answer)
+        for question, text, answer in models.Question.objects.filter(
+            id__in=ids).values_list('id', 'question_text', 'answer_text')}
+    if len(questions) < len(ids):
+        raise CommandError('Questions of these games were deleted')
+    return questions
+
+class Replay:
+    '''Plays recorded events through test clients, one per player.'''
+    def __init__(self, events, questions):
+        self.events = events
+        # Question id -> (text, answer), from deck_questions
+        self.questions = questions
+        self.recorder = Recorder()
+        self.host = self.recorder.client()
+        # Recorded game id -> its join code in the replay
+        self.codes = {}
+        # Recorded player id -> (test client, name)
+        self.players = {}
+
+    def run(self, speed, concurrency):
+        '''Apply the events at `speed` times their recorded pace.'''
+        start = time.perf_counter()
+        first = self.events[0].time
+        # Each event waits for the previous one of its game's host and
+        # of its player. Votes also wait for their round's answers, and
+        # closing a round for all of its game's events since the last close.
+        last = {}
+        answers = {}
+        pending = {}
+        with ThreadPoolExecutor(concurrency) as pool:
+            for event in self.events:
+                delay = ((event.time - first).total_seconds() / speed -
+                         (time.perf_counter() - start))
+                if delay > 0:
+                    time.sleep(delay)
+                after = [last.get(('game', event.game))]
+                if event.kind == gamelog.NEXT:
+                    after.extend(pending.pop(event.game, ()))
+                    answers.pop(event.game, None)
+                elif event.kind != gamelog.START:
+                    after.append(last.get(event.data.get('player')))
+                if event.kind == gamelog.VOTE:
+                    after.extend(answers.get(event.game, ()))
+                future = pool.submit(self.apply, event, *after)
+                if event.kind in (gamelog.START, gamelog.NEXT):
+                    last[('game', event.game)] = future
+                else:
+                    last[event.data['player']] = future
+                    pending.setdefault(event.game, []).append(future)
+                if event.kind == gamelog.ANSWER:
+                    answers.setdefault(event.game, []).append(future)
+            close_connections(pool, concurrency)
+
+    def apply(self, event, *after):
+        for future in after:
+            if future is not None:
+                future.exception()
+        getattr(self, event.kind)(event.game, **event.data)
+
+    def start(self, game, code, topic, num_answers, deck):
+        topic = models.Topic.objects.create(name=f'{topic} (replay of {code})')
+        # Created in the dealt order, which start_new keeps by ordering by id
+        models.Question.objects.bulk_create([
+            models.Question(
+                topic=topic, question_text=text, answer_text=answer)
+            for text, answer in map(self.questions.get, deck)])
+        response = self.recorder.request(
+            self.host, 'post', '/manage/start_new/', {
+                'topic': topic.name, 'num_answers': num_answers})
+        self.codes[game] = response.url.split('/')[1]
+
+    def register(self, game, player, name):
+        client = self.recorder.client()
+        self.players[player] = client, name
+        self.recorder.request(client, 'post', '/register/', {
+            'code': self.codes[game], 'name': name})
+
+    def answer(self, game, player, answer):
+        code = self.codes[game]
+        self.recorder.request(
+            self.players[player][0], 'post', f'/{code}/open_question/',
+            {'answer': answer})
+
+    def vote(self, game, player, author):
+        code = self.codes[game]
+        replayed = models.Game.objects.get(code=code)
+        # The real answer's slot is the last
+        slot = replayed.slot_order[-1]
+        if author is not None:
+            slot = models.Answer.objects.filter(
+                game=replayed, question=replayed.current_id,
+                author__name=self.players[author][1],
+                ).values_list('permutation_order', flat=True).first()
+            if slot is None:
+                # The answer wasn't accepted in the replay
+                return
+        self.recorder.request(
+            self.players[player][0], 'post', f'/{code}/quiz/',
+            {'answer': slot})
+
+    def next(self, game, round):
+        code = self.codes[game]
+        self.recorder.request(
+            self.host, 'post', f'/{code}/manage/next/', {'round': round})
@@ -0,0 +1,67 @@
+"""Per-request query counts and timings.
+
+`QueryMetricsMiddleware` counts each request's database queries and
+times them and the whole request, then reports them by view: logged to
+the ``psykahut.metrics`` logger and returned in a ``Server-Timing``
+header, so they show up in the browser's network panel. The request's
+`QueryMetrics` is left on it as ``request.query_metrics``, for other
+middleware to use rather than time each query again.
+"""
+import contextlib
+import logging
+import time
+
+from django.db import connections
+
+logger = logging.getLogger('psykahut.metrics')
+
+class QueryMetrics:
+    '''
+    An execute_wrapper counting and timing queries. The first `keep` are
+    also kept in `queries`, as (sql, milliseconds).
+    '''
+    def __init__(self, keep=0):
+        self.count = 0
+        self.db_time = 0.0
+        self.keep = keep
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.db_time += elapsed
+            if len(self.queries) < self.keep:
+                self.queries.append((sql, elapsed * 1000))
+
+class QueryMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = request.query_metrics = QueryMetrics()
+        start = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match else None
+        response['Server-Timing'] = (
+            f'db;desc="{metrics.count} queries";dur={metrics.db_time * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}')
+        logger.info(
+            '%s %s: %d queries, %.1fms db, %.1fms total',
+            view, response.status_code, metrics.count,
+            metrics.db_time * 1000, total * 1000,
+            extra={
+                'view': view,
+                'queries': metrics.count,
+                'db_ms': metrics.db_time * 1000,
+                'total_ms': total * 1000,
+            })
+        return response
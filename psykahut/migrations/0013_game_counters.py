@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:24
+
+from django.db import migrations, models
+
+
+def count_existing(apps, schema_editor):
+    Game = apps.get_model('psykahut', 'Game')
+    Answer = apps.get_model('psykahut', 'Answer')
+    Vote = apps.get_model('psykahut', 'Vote')
+    for game in Game.objects.all():
+        game.answer_count = Answer.objects.filter(
+            game=game, question_id=game.current_id).count()
+        game.vote_count = Vote.objects.filter(
+            game=game, question_id=game.current_id).count()
+        game.questions_asked_count = game.questions_asked.count()
+        if game.answer_count >= game.num_psych_answers:
+            game.phase = 'quiz'
+        game.save()
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psykahut', '0012_game_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='answer_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='phase',
+            field=models.CharField(choices=[('open', 'open question'), ('quiz', 'quiz')], default='open', max_length=4),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='questions_asked_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='vote_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psykahut', '0013_game_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoundSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.JSONField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='psykahut.game')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='psykahut.question')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='roundsummary',
+            constraint=models.UniqueConstraint(fields=('game', 'question'), name='unique_round_summary'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:26
+
+import random
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_decks(apps, schema_editor):
+    '''Decks for existing games: asked questions, current, then the rest.'''
+    Game = apps.get_model('psykahut', 'Game')
+    Question = apps.get_model('psykahut', 'Question')
+    DeckEntry = apps.get_model('psykahut', 'DeckEntry')
+    for game in Game.objects.all():
+        asked = list(game.questions_asked.order_by('id').values_list('id', flat=True))
+        if game.current_id is not None:
+            asked.append(game.current_id)
+        rest = list(Question.objects.filter(topic_id=game.topic_id).exclude(
+            id__in=asked).order_by('id').values_list('id', flat=True))
+        if game.shuffle:
+            random.shuffle(rest)
+        DeckEntry.objects.bulk_create([
+            DeckEntry(game=game, position=position, question_id=question)
+            for position, question in enumerate(asked + rest)])
+        Game.objects.filter(id=game.id).update(
+            questions_asked_count=len(asked) - (game.current_id is not None))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psykahut', '0014_roundsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeckEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='psykahut.game')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='psykahut.question')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='deckentry',
+            constraint=models.UniqueConstraint(fields=('game', 'position'), name='unique_deck_position'),
+        ),
+        migrations.RunPython(build_decks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='game',
+            name='questions_asked',
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:27
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min
+
+
+def duplicates(model, *fields):
+    '''Groups of `model` rows with the same `fields`, as (values, lowest id).'''
+    for group in model.objects.values(*fields).annotate(
+            num=Count('id'), keep=Min('id')).filter(num__gt=1).order_by():
+        keep = group.pop('keep')
+        group.pop('num')
+        yield group, keep
+
+
+def remove_duplicates(apps, schema_editor):
+    '''
+    Merge the rows that raced in before these constraints, keeping the
+    lowest id of each group.
+    '''
+    Player = apps.get_model('psykahut', 'Player')
+    Answer = apps.get_model('psykahut', 'Answer')
+    Vote = apps.get_model('psykahut', 'Vote')
+    # Players who joined twice under one name
+    for group, keep in duplicates(Player, 'game', 'name'):
+        others = Player.objects.filter(**group).exclude(id=keep)
+        Player.objects.filter(id=keep).update(score=F('score') + sum(
+            others.values_list('score', flat=True)))
+        Answer.objects.filter(author__in=others).update(author=keep)
+        Vote.objects.filter(voter__in=others).update(voter=keep)
+        others.delete()
+    # Players who answered twice
+    for group, keep in duplicates(Answer, 'game', 'question', 'author'):
+        others = Answer.objects.filter(**group).exclude(id=keep)
+        Vote.objects.filter(answer__in=others).update(answer=keep)
+        others.delete()
+    # Answers given the same slot, moved past the round's other slots
+    for group, keep in duplicates(
+            Answer, 'game', 'question', 'permutation_order'):
+        slot = Answer.objects.filter(
+            game=group['game'], question=group['question']).aggregate(
+            Max('permutation_order'))['permutation_order__max']
+        for answer in Answer.objects.filter(**group).exclude(
+                id=keep).order_by('id'):
+            slot += 1
+            Answer.objects.filter(id=answer.id).update(permutation_order=slot)
+    # Players who voted twice
+    for group, keep in duplicates(Vote, 'game', 'question', 'voter'):
+        Vote.objects.filter(**group).exclude(id=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psykahut', '0015_deck'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='topic',
+            name='name',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='answer',
+            constraint=models.UniqueConstraint(fields=('game', 'question', 'permutation_order'), name='unique_answer_slot'),
+        ),
+        migrations.AddConstraint(
+            model_name='answer',
+            constraint=models.UniqueConstraint(fields=('game', 'question', 'author'), name='unique_answer_author'),
+        ),
+        migrations.AddConstraint(
+            model_name='player',
+            constraint=models.UniqueConstraint(fields=('game', 'name'), name='unique_player_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('game', 'question', 'voter'), name='unique_vote'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:29
+
+import random
+
+from django.db import migrations, models
+
+
+def deal_slots(apps, schema_editor):
+    '''Taken slots first, in answer order, then the free ones shuffled.'''
+    Game = apps.get_model('psykahut', 'Game')
+    Answer = apps.get_model('psykahut', 'Answer')
+    for game in Game.objects.all():
+        taken = list(Answer.objects.filter(
+            game=game, question_id=game.current_id).order_by('id').values_list(
+            'permutation_order', flat=True))
+        free = [x for x in range(game.num_psych_answers + 1) if x not in taken]
+        random.shuffle(free)
+        Game.objects.filter(id=game.id).update(slot_order=taken + free)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psykahut', '0016_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='slot_order',
+            field=models.JSONField(default=list),
+        ),
+        migrations.RunPython(deal_slots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:30
+
+from django.db import migrations, models
+import psykahut.models
+
+
+def assign_codes(apps, schema_editor):
+    Game = apps.get_model('psykahut', 'Game')
+    taken = set()
+    for game_id in Game.objects.values_list('id', flat=True):
+        code = psykahut.models.random_code()
+        while code in taken:
+            code = psykahut.models.random_code()
+        taken.add(code)
+        Game.objects.filter(id=game_id).update(code=code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psykahut', '0017_game_slot_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='code',
+            field=models.CharField(max_length=8, null=True),
+        ),
+        migrations.RunPython(assign_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='game',
+            name='code',
+            field=models.CharField(default=psykahut.models.random_code, max_length=8, unique=True),
+        ),
+    ]
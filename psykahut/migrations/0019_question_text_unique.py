@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:36
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    '''
+    Merge questions entered twice in a topic into the one with the
+    lowest id, moving what refers to them over to it.
+    '''
+    Question = apps.get_model('psykahut', 'Question')
+    Game = apps.get_model('psykahut', 'Game')
+    DeckEntry = apps.get_model('psykahut', 'DeckEntry')
+    rounds = [
+        apps.get_model('psykahut', x)
+        for x in ['Answer', 'Vote', 'RoundSummary']]
+    for group in Question.objects.values('topic', 'question_text').annotate(
+            num=Count('id'), keep=Min('id')).filter(num__gt=1).order_by():
+        keep = group['keep']
+        others = list(Question.objects.filter(
+            topic=group['topic'], question_text=group['question_text'],
+            ).exclude(id=keep).values_list('id', flat=True))
+        Game.objects.filter(current__in=others).update(current=keep)
+        Game.objects.filter(prev__in=others).update(prev=keep)
+        DeckEntry.objects.filter(question__in=others).update(question=keep)
+        # A game that asked both keeps only the kept question's round
+        asked = set()
+        for model in rounds:
+            asked.update(model.objects.filter(question=keep).values_list(
+                'game_id', flat=True))
+        for model in rounds:
+            model.objects.filter(question__in=others).exclude(
+                game__in=asked).update(question=keep)
+        Question.objects.filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psykahut', '0018_game_code'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='question',
+            constraint=models.UniqueConstraint(fields=('topic', 'question_text'), name='unique_question_text'),
+        ),
+    ]
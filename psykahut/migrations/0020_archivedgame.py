@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psykahut', '0019_question_text_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedGame',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=8, unique=True)),
+                ('topic', models.CharField(max_length=200)),
+                ('started', models.DateTimeField()),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+                ('data', models.JSONField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:39
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+    '''Topic and all-time totals of the games played so far.'''
+    Player = apps.get_model('psykahut', 'Player')
+    Leaderboard = apps.get_model('psykahut', 'Leaderboard')
+    LeaderboardEntry = apps.get_model('psykahut', 'LeaderboardEntry')
+    totals = {'all': Player.objects.values_list('name').annotate(Sum('score'))}
+    for topic_id in Player.objects.values_list(
+            'game__topic_id', flat=True).distinct():
+        totals[f'topic:{topic_id}'] = Player.objects.filter(
+            game__topic_id=topic_id).values_list('name').annotate(Sum('score'))
+    for scope, scores in totals.items():
+        board = Leaderboard.objects.create(scope=scope)
+        LeaderboardEntry.objects.bulk_create([
+            LeaderboardEntry(leaderboard=board, name=name, score=score)
+            for name, score in scores.iterator()], batch_size=500)
+        board.top = list(board.leaderboardentry_set.order_by(
+            '-score', 'name').values('name', 'score')[
+            :settings.PSYKAHUT_LEADERBOARD_SIZE])
+        board.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psykahut', '0020_archivedgame'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Leaderboard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=32, unique=True)),
+                ('top', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('score', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['game', '-score', 'name'], name='player_game_score'),
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='leaderboard',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='psykahut.leaderboard'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['leaderboard', '-score', 'name'], name='leaderboard_score'),
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardentry',
+            constraint=models.UniqueConstraint(fields=('leaderboard', 'name'), name='unique_leaderboard_name'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
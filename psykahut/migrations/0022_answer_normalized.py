@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+from psykahut.models import normalize_answer
+
+
+def fill_normalized(apps, schema_editor):
+    Answer = apps.get_model('psykahut', 'Answer')
+    seen = set()
+    for answer in Answer.objects.order_by('id').iterator():
+        normalized = normalize_answer(answer.text)
+        key = (answer.game_id, answer.question_id, normalized)
+        if key in seen:
+            # Given before duplicates were rejected; keep it distinct
+            normalized = f'{normalized[:180]} #{answer.id}'
+        seen.add(key)
+        Answer.objects.filter(id=answer.id).update(normalized=normalized)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psykahut', '0021_leaderboards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='normalized',
+            field=models.CharField(default='', max_length=200),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_normalized, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='answer',
+            constraint=models.UniqueConstraint(fields=('game', 'question', 'normalized'), name='unique_answer_text'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psykahut', '0023_gameevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='psykahut.question')),
+                ('rounds', models.IntegerField(default=0)),
+                ('real_votes', models.IntegerField(default=0)),
+                ('fake_votes', models.IntegerField(default=0)),
+                ('fake_answers', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
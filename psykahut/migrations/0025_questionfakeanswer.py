@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psykahut', '0024_questionstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionFakeAnswer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('normalized', models.CharField(max_length=200)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='psykahut.question')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='questionfakeanswer',
+            constraint=models.UniqueConstraint(fields=('question', 'normalized'), name='unique_question_fake_answer'),
+        ),
+    ]
@@ -1,9 +1,13 @@
+import random
+import unicodedata
+
 from django.db import models
+from django.utils import timezone
 
 # One topic for testing without revealing answers,
 # other used in actual game.
 class Topic(models.Model):
-    name = models.CharField(max_length=200)
+    name = models.CharField(max_length=200, db_index=True)
     def __str__(self):
         return self.name
 
@@ -12,37 +16,133 @@ class Question(models.Model):
     question_text = models.CharField(max_length=200)
     # The real answer for the question
     answer_text = models.CharField(max_length=200)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['topic', 'question_text'], name='unique_question_text'),
+        ]
+
     def __str__(self):
         return f'{self.topic}: {self.question_text} ({self.answer_text})'
 
+# Without look-alikes such as O and 0
+CODE_CHARS = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+CODE_LENGTH = 5
+
+def random_code():
+    return ''.join(random.choice(CODE_CHARS) for _ in range(CODE_LENGTH))
+
 class Game(models.Model):
+    OPEN = 'open'
+    QUIZ = 'quiz'
+    PHASES = [(OPEN, 'open question'), (QUIZ, 'quiz')]
+
     started = models.DateTimeField('date created', auto_now_add=True)
+    # What players type to join the game's room
+    code = models.CharField(max_length=8, unique=True, default=random_code)
     topic = models.ForeignKey(Topic, on_delete=models.CASCADE)
-    questions_asked = models.ManyToManyField(Question, blank=True)
     current = models.ForeignKey(Question, blank=True, null=True, on_delete=models.CASCADE, related_name='current')
     prev = models.ForeignKey(Question, blank=True, null=True, on_delete=models.CASCADE, related_name='prev')
     num_psych_answers = models.IntegerField(default=4)
     shuffle = models.BooleanField(default=True)
+    # Bumped on every write that changes what players see.
+    # Used by polling clients as an ETag.
+    version = models.IntegerField(default=0)
+    # Counters for the current question, kept up to date with the
+    # version so that phase checks don't need to count rows.
+    phase = models.CharField(max_length=4, choices=PHASES, default=OPEN)
+    answer_count = models.IntegerField(default=0)
+    vote_count = models.IntegerField(default=0)
+    # Also the position of the current question in the deck
+    questions_asked_count = models.IntegerField(default=0)
+    # Shuffled permutation slots for the current question. The n-th
+    # answer takes the n-th slot, and the real answer the last one.
+    slot_order = models.JSONField(default=list)
     def __str__(self):
         return f'Game({self.current or self.topic}, {self.started})'
 
+    @property
+    def questions_asked(self):
+        return Question.objects.filter(
+            deckentry__game=self,
+            deckentry__position__lt=self.questions_asked_count)
+
+class DeckEntry(models.Model):
+    '''A game's questions, in the order they are asked.'''
+    game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    position = models.IntegerField()
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['game', 'position'], name='unique_deck_position'),
+        ]
+
+    def __str__(self):
+        return f'{self.game_id} #{self.position}: {self.question_id}'
+
 class Player(models.Model):
     name = models.CharField(max_length=200)
     game = models.ForeignKey(Game, on_delete=models.CASCADE)
     score = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['game', 'name'], name='unique_player_name'),
+        ]
+        indexes = [
+            # For the game's leaderboard
+            models.Index(
+                fields=['game', '-score', 'name'], name='player_game_score'),
+        ]
+
     def __str__(self):
         return f'{self.name}: {self.score}'
 
+def normalize_answer(text):
+    '''
+    `text` with case, punctuation, diacritics (such as niqqud) and
+    extra whitespace dropped, for telling whether answers are the same.
+    '''
+    chars = []
+    for c in unicodedata.normalize('NFKD', text.casefold()):
+        category = unicodedata.category(c)
+        if category.startswith('P'):
+            chars.append(' ')
+        elif category != 'Mn':
+            chars.append(c)
+    return ' '.join(''.join(chars).split())[:200]
+
 class Answer(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     author = models.ForeignKey(Player, on_delete=models.CASCADE)
     text = models.CharField(max_length=200)
+    # normalize_answer(text), so that the database rejects the same
+    # answer given twice
+    normalized = models.CharField(max_length=200)
     permutation_order = models.IntegerField()
 
-    # game is redundat to author.game, but repeats for
-    # query optimization (guessing here)
+    # game is redundant to author.game, but repeats so that
+    # the (game, question, ...) constraints below index
+    # the current answers lookup.
     game = models.ForeignKey(Game, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['game', 'question', 'permutation_order'],
+                name='unique_answer_slot'),
+            models.UniqueConstraint(
+                fields=['game', 'question', 'author'],
+                name='unique_answer_author'),
+            models.UniqueConstraint(
+                fields=['game', 'question', 'normalized'],
+                name='unique_answer_text'),
+        ]
+
     def __str__(self):
         return f'{self.question.question_text}: {self.text} ({self.game.started})'
 
@@ -51,9 +151,145 @@ class Vote(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     answer = models.ForeignKey(Answer, null=True, on_delete=models.CASCADE)
 
-    # game is redundat to voter.game, but repeats for
-    # query optimization (guessing here)
+    # game is redundant to voter.game, but repeats so that
+    # the constraint below indexes votes by round.
     game = models.ForeignKey(Game, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['game', 'question', 'voter'], name='unique_vote'),
+        ]
+
     def __str__(self):
         return f'{self.voter}: {self.question} is {self.answer}'
+
+class RoundSummary(models.Model):
+    '''
+    The results of a closed round, as shown by summary.html.
+    Written once when the round closes, never changed.
+    '''
+    game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    data = models.JSONField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['game', 'question'], name='unique_round_summary'),
+        ]
+
+    def __str__(self):
+        return f'{self.game_id}: {self.data["question"]}'
+
+class QuestionStats(models.Model):
+    '''
+    How psychable a question has been, over the rounds that asked it.
+    Added to by stats.record_round() as each round closes.
+    '''
+    question = models.OneToOneField(
+        Question, primary_key=True, on_delete=models.CASCADE)
+    rounds = models.IntegerField(default=0)
+    real_votes = models.IntegerField(default=0)
+    fake_votes = models.IntegerField(default=0)
+    # Distinct psych answers given, counting QuestionFakeAnswer rows
+    fake_answers = models.IntegerField(default=0)
+
+    @property
+    def fooled_rate(self):
+        '''The share of votes that went to fake answers.'''
+        votes = self.real_votes + self.fake_votes
+        return votes and self.fake_votes / votes
+
+    def __str__(self):
+        return f'{self.question_id}: {self.fake_votes}/{self.real_votes}'
+
+class QuestionFakeAnswer(models.Model):
+    '''
+    A psych answer a question has drawn, by normalize_answer(), however
+    many games gave it. Outlives the games, for QuestionStats.fake_answers.
+    '''
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    normalized = models.CharField(max_length=200)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['question', 'normalized'],
+                name='unique_question_fake_answer'),
+        ]
+
+    def __str__(self):
+        return f'{self.question_id}: {self.normalized}'
+
+class Leaderboard(models.Model):
+    '''
+    The top scores of a scope: 'all' (all time), 'topic:<id>' or
+    'game:<id>'. Kept up to date by leaderboards.record() as rounds close.
+    '''
+    scope = models.CharField(max_length=32, unique=True)
+    # [{'name': ..., 'score': ...}], best first
+    top = models.JSONField(default=list)
+
+    def __str__(self):
+        return self.scope
+
+class LeaderboardEntry(models.Model):
+    '''
+    A name's total score in a topic or all-time leaderboard. Players of
+    different games are the same entry if they have the same name.
+    '''
+    leaderboard = models.ForeignKey(Leaderboard, on_delete=models.CASCADE)
+    name = models.CharField(max_length=200)
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['leaderboard', 'name'], name='unique_leaderboard_name'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['leaderboard', '-score', 'name'],
+                name='leaderboard_score'),
+        ]
+
+    def __str__(self):
+        return f'{self.name}: {self.score}'
+
+class GameEvent(models.Model):
+    '''
+    A write to a game, as recorded by gamelog.record(). Only ever
+    appended to, and not tied to the game's rows, so it outlives them.
+    '''
+    time = models.DateTimeField(default=timezone.now)
+    game = models.IntegerField()
+    kind = models.CharField(max_length=16)
+    data = models.JSONField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['game', 'id'], name='game_event_order'),
+        ]
+
+    def __str__(self):
+        return f'{self.game} {self.time} {self.kind}'
+
+class ArchivedGame(models.Model):
+    '''
+    What's kept of a game once its rows are pruned (see archive.py):
+    the final scores and each closed round's summary, in the order asked.
+    '''
+    code = models.CharField(max_length=8, unique=True)
+    # By name, so that archives outlive their topic
+    topic = models.CharField(max_length=200)
+    started = models.DateTimeField()
+    archived = models.DateTimeField(auto_now_add=True)
+    # {'scores': [{'name': ..., 'score': ...}], 'rounds': [summary, ...]}
+    data = models.JSONField()
+
+    def __str__(self):
+        return f'{self.code}: {self.topic} ({self.started})'
+
+    def get_absolute_url(self):
+        return f'/archive/{self.code}/'
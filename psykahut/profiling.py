@@ -0,0 +1,158 @@
+"""Profiling requests in production.
+
+`ProfilingMiddleware` runs a ``PSYKAHUT_PROFILE_RATE`` fraction of
+requests under cProfile, and saves each one's stats along with the SQL
+it issued, under ``PSYKAHUT_PROFILE_DIR/<view>/``.
+
+Requests slower than ``PSYKAHUT_PROFILE_SLOW`` are saved too. cProfile
+has to be running from the start of a request, so a slow request that
+wasn't sampled is saved with its SQL only, and the next
+``PSYKAHUT_PROFILE_AFTER_SLOW`` requests of its view are profiled.
+
+With neither set the middleware removes itself. The
+``profile_report`` command sums up what was saved.
+"""
+import contextlib
+import cProfile
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+from .middleware import QueryMetrics
+
+# Queries kept per saved request
+MAX_QUERIES = 500
+
+# View name -> requests still to profile after one ran slow
+_armed = {}
+_armed_lock = threading.Lock()
+
+def view_dir(view):
+    return os.path.join(
+        settings.PSYKAHUT_PROFILE_DIR, re.sub(r'[^\w.-]', '_', view))
+
+def _should_profile(view):
+    if random.random() < settings.PSYKAHUT_PROFILE_RATE:
+        return True
+    with _armed_lock:
+        left = _armed.get(view)
+        if not left:
+            return False
+        if left == 1:
+            del _armed[view]
+        else:
+            _armed[view] = left - 1
+    return True
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if (not settings.PSYKAHUT_PROFILE_RATE and
+                settings.PSYKAHUT_PROFILE_SLOW is None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            view = resolve(request.path_info).view_name
+        except Resolver404:
+            view = None
+        if view is None or view in settings.PSYKAHUT_PROFILE_IGNORE:
+            return self.get_response(request)
+        profiler = cProfile.Profile() if _should_profile(view) else None
+        start = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            # Have QueryMetricsMiddleware's wrapper keep the queries, if
+            # it's installed, rather than time them twice
+            metrics = getattr(request, 'query_metrics', None)
+            if metrics is None:
+                metrics = QueryMetrics()
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+            metrics.keep = MAX_QUERIES
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+        total_ms = (time.perf_counter() - start) * 1000
+        slow = (settings.PSYKAHUT_PROFILE_SLOW is not None and
+                total_ms >= settings.PSYKAHUT_PROFILE_SLOW)
+        if slow and not profiler:
+            with _armed_lock:
+                _armed[view] = settings.PSYKAHUT_PROFILE_AFTER_SLOW
+        if profiler or slow:
+            save(view, request, response, total_ms, metrics, profiler, slow)
+        return response
+
+def save(view, request, response, total_ms, metrics, profiler, slow):
+    directory = view_dir(view)
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.join(
+        directory, f'{time.time_ns()}-{os.getpid()}-{threading.get_ident()}')
+    if profiler:
+        profiler.dump_stats(name + '.prof')
+    with open(name + '.json', 'w') as f:
+        json.dump({
+            'view': view,
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': total_ms,
+            'slow': slow,
+            'profiled': profiler is not None,
+            'num_queries': metrics.count,
+            'queries': metrics.queries,
+        }, f)
+    prune(directory)
+
+def prune(directory):
+    '''Keep only the newest ``PSYKAHUT_PROFILE_KEEP`` requests of a view.'''
+    saved = sorted(
+        x[:-len('.json')] for x in os.listdir(directory) if x.endswith('.json'))
+    for name in saved[:-settings.PSYKAHUT_PROFILE_KEEP]:
+        for ext in ('.json', '.prof'):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(directory, name + ext))
+
+def load(view=None):
+    '''
+    The saved requests, as {view: [(request info, .prof path or None)]},
+    optionally only those of `view`.
+    '''
+    root = settings.PSYKAHUT_PROFILE_DIR
+    result = {}
+    if not os.path.isdir(root):
+        return result
+    for entry in sorted(os.listdir(root)):
+        directory = os.path.join(root, entry)
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                # Being written, or pruned meanwhile
+                continue
+            if view is not None and info['view'] != view:
+                continue
+            prof = os.path.join(directory, name[:-len('.json')] + '.prof')
+            result.setdefault(info['view'], []).append(
+                (info, prof if info['profiled'] else None))
+    return result
+
+def normalize_sql(sql):
+    '''`sql` with literals and IN lists collapsed, to group queries by shape.'''
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    return re.sub(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)', '(...)', sql)
@@ -0,0 +1,79 @@
+"""Reading and writing question banks as CSV or JSON lines.
+
+Rows have the fields in `FIELDS`. Both directions stream, one batch of
+rows at a time, so banks needn't fit in memory.
+"""
+import csv
+import itertools
+import json
+
+from . import models
+
+FIELDS = ('topic', 'question_text', 'answer_text')
+FORMATS = ('csv', 'jsonl')
+
+def guess_format(path):
+    return 'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv'
+
+def read_rows(f, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(f)
+    else:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def write_rows(f, fmt, rows):
+    if fmt == 'csv':
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            f.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False))
+            f.write('\n')
+
+def export_rows(topics=None, chunk_size=2000):
+    '''The questions of `topics` (names), or of all topics, as tuples of `FIELDS`.'''
+    questions = models.Question.objects.order_by('id')
+    if topics:
+        questions = questions.filter(topic__name__in=topics)
+    return questions.values_list(
+        'topic__name', *FIELDS[1:]).iterator(chunk_size=chunk_size)
+
+def import_rows(rows, batch_size=500, topic=None):
+    '''
+    Add questions from `rows` (dicts with `FIELDS`), skipping those whose
+    topic already has a question with the same text. `topic` overrides
+    the rows' topic. Yields (rows read, questions added) after each batch.
+    '''
+    topic_ids = {}
+    def get_topic_id(name):
+        if name not in topic_ids:
+            found = models.Topic.objects.filter(name=name).order_by(
+                'id').values_list('id', flat=True).first()
+            if found is None:
+                found = models.Topic.objects.create(name=name).id
+            topic_ids[name] = found
+        return topic_ids[name]
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        questions = {}
+        for row in batch:
+            key = (get_topic_id(topic or row['topic']), row['question_text'])
+            questions.setdefault(key, row['answer_text'])
+        existing = set(models.Question.objects.filter(
+            topic_id__in={x for x, _ in questions},
+            question_text__in={x for _, x in questions},
+            ).values_list('topic_id', 'question_text'))
+        new = [
+            models.Question(
+                topic_id=topic_id, question_text=text, answer_text=answer)
+            for (topic_id, text), answer in questions.items()
+            if (topic_id, text) not in existing]
+        # Conflicts are from concurrent imports of the same questions
+        models.Question.objects.bulk_create(new, ignore_conflicts=True)
+        yield len(batch), len(new)
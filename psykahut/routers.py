@@ -0,0 +1,55 @@
+"""Sending reads to database replicas.
+
+`ReplicaMiddleware` marks GET and HEAD requests as reading from a
+replica (one of ``PSYKAHUT_REPLICAS``, picked per request), and
+`ReplicaRouter` then sends their reads there. Everything else, all
+writes, and reads following a write in the same request, go to the
+primary (``default``).
+
+Replicas lag behind, so a client that just wrote gets a cookie pinning
+its reads to the primary for ``PSYKAHUT_REPLICA_PIN`` seconds, to see
+its own answer or vote straight away.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+
+PIN_COOKIE = 'psykahut_primary'
+
+# The replica the current request reads from, if any
+_replica = contextvars.ContextVar('replica', default=None)
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        # Reads after a write in the same request should see it
+        _replica.set(None)
+        return 'default'
+
+def replica_for(request):
+    '''The replica alias the request may read from, or None.'''
+    if (not settings.PSYKAHUT_REPLICAS or
+            request.method not in ('GET', 'HEAD') or
+            PIN_COOKIE in request.COOKIES):
+        return None
+    return random.choice(settings.PSYKAHUT_REPLICAS)
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _replica.set(replica_for(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica.reset(token)
+        if (settings.PSYKAHUT_REPLICAS and
+                request.method not in ('GET', 'HEAD', 'OPTIONS')):
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.PSYKAHUT_REPLICA_PIN,
+                httponly=True, samesite='Lax')
+        return response
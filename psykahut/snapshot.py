@@ -0,0 +1,114 @@
+"""Cached snapshots of a game's current round.
+
+Within a round almost every request needs the same rows: the game,
+its current question and the answers given so far. A `Round` holds
+them, cached under the game's id and state version, so it is built
+once per write rather than once per request. Since the version is part
+of the key, nothing needs invalidating; stale rounds just expire.
+"""
+import dataclasses
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import models, state
+
+@dataclasses.dataclass(frozen=True)
+class Round:
+    # With topic, current and prev loaded
+    game: models.Game
+    # Answers to the current question, by permutation_order
+    answers: tuple
+    is_quiz: bool
+    # The state version it was cached under
+    version: int
+
+def current_round(game_id):
+    cur_state = state.current_state(game_id)
+    return cur_state and get_round(*cur_state)
+
+def recent_state(game_id):
+    '''
+    (game id, version, vote count) as of at most
+    ``PSYKAHUT_SPECTATOR_REFRESH`` seconds ago, or None. Cached, so
+    however many requests ask, each process reads them about once per
+    period.
+    '''
+    return _single_flight(
+        f'psykahut:state:{game_id}',
+        lambda: models.Game.objects.filter(id=game_id).values_list(
+            'id', 'version', 'vote_count').first() or (),
+        settings.PSYKAHUT_SPECTATOR_REFRESH) or None
+
+def get_round(game_id, version):
+    return _single_flight(
+        f'psykahut:round:{game_id}:{version}', lambda: _build(game_id, version))
+
+def get_page(cur, name, render):
+    '''
+    A page that's the same for every player in round `cur`, rendered by
+    `render` once and cached along with the round.
+    '''
+    return _single_flight(
+        f'psykahut:page:{cur.game.id}:{cur.version}:{name}', render)
+
+def _build(game_id, version):
+    game = models.Game.objects.select_related(
+        'topic', 'current', 'prev').get(id=game_id)
+    answers = ()
+    if game.current_id is not None:
+        answers = tuple(models.Answer.objects.filter(
+            game=game, question_id=game.current_id
+            ).order_by('permutation_order'))
+    return Round(
+        game=game,
+        answers=answers,
+        is_quiz=game.phase == models.Game.QUIZ,
+        version=version,
+        )
+
+# Per-key locks, so that concurrent misses in this process wait for a
+# single build instead of all running the same queries.
+_locks = {}
+_locks_lock = threading.Lock()
+
+def _single_flight(key, build, timeout=None):
+    value = cache.get(key)
+    if value is not None:
+        return value
+    with _locks_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        try:
+            value = cache.get(key)
+            if value is None:
+                value = _build_shared(key, build, timeout)
+        finally:
+            with _locks_lock:
+                _locks.pop(key, None)
+    return value
+
+def _build_shared(key, build, timeout=None):
+    '''
+    Build `key` unless another process is already doing so, in which
+    case wait for its result (building anyway if it takes too long).
+    '''
+    lock_key = key + ':building'
+    wait = settings.PSYKAHUT_SNAPSHOT_BUILD_TIMEOUT
+    if not cache.add(lock_key, True, wait):
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(0.02)
+            value = cache.get(key)
+            if value is not None:
+                return value
+    try:
+        value = build()
+        if timeout is None:
+            timeout = settings.PSYKAHUT_SNAPSHOT_TTL
+        cache.set(key, value, timeout)
+    finally:
+        cache.delete(lock_key)
+    return value
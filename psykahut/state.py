@@ -0,0 +1,167 @@
+"""Game state versions.
+
+Every write that changes what players see bumps ``Game.version``.
+Polling clients send it back as an ETag, and can be held open
+(long-polled) until it moves instead of re-fetching every 1.5s.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from . import models
+
+# Wakes up long-polls held in this process when a local write commits.
+# Writes from other processes are noticed on the periodic re-check.
+_changed = threading.Condition()
+# Game id -> number of local commits, so waiters only re-check their own
+_generations = {}
+_num_waiting = 0
+
+def game_id(code):
+    '''The id of the game whose join code is `code`, or None.'''
+    key = f'psykahut:code:{code}'
+    result = cache.get(key)
+    if result is None:
+        result = models.Game.objects.filter(code=code).values_list(
+            'id', flat=True).first()
+        if result is not None:
+            # Codes are never reassigned
+            cache.set(key, result, None)
+    return result
+
+def forget_code(code):
+    '''Drop the cached game id of `code` once the current transaction commits.'''
+    transaction.on_commit(lambda: cache.delete(f'psykahut:code:{code}'))
+
+def current_state(game_id):
+    '''(game id, version), or None if there's no such game.'''
+    return models.Game.objects.filter(id=game_id).values_list(
+        'id', 'version').first()
+
+def etag(state):
+    return '"%d.%d"' % state if state else '"none"'
+
+def bump_version(game, only_if=None, **updates):
+    '''
+    Bump the game's version, along with any other `updates` to its row,
+    provided that it matches `only_if`. Returns whether it did.
+    '''
+    updated = models.Game.objects.filter(id=game.id, **(only_if or {})).update(
+        version=F('version') + 1, **updates)
+    if updated:
+        transaction.on_commit(lambda: _notify(game.id))
+    return updated
+
+def deal_slots(num_psych_answers):
+    slots = list(range(num_psych_answers + 1))
+    random.shuffle(slots)
+    return slots
+
+def claim_slot(game):
+    '''
+    Claim the next permutation slot for an answer to the game's current
+    question, as part of the current transaction, which must then add
+    the answer. The game row stays locked until it commits, so claims
+    are handed out one at a time without retries.
+
+    Returns (the number of answers including this one, the slot), or
+    None when the question has all its answers or was already replaced.
+    '''
+    if not bump_version(
+            game,
+            only_if={
+                'current': game.current_id,
+                'answer_count__lt': F('num_psych_answers'),
+                },
+            answer_count=F('answer_count') + 1,
+        # Updates see the row's values from before the update
+        phase=Case(
+            When(answer_count__gte=F('num_psych_answers') - 1,
+                 then=Value(models.Game.QUIZ)),
+            default=F('phase')),
+            ):
+        return None
+    answer_count, slot_order = models.Game.objects.values_list(
+        'answer_count', 'slot_order').get(id=game.id)
+    return answer_count, slot_order[answer_count - 1]
+
+def vote_added(game):
+    '''
+    Count a vote. Votes change nothing players see, so the version (and
+    with it their ETag) stays, and held polls aren't woken.
+    '''
+    models.Game.objects.filter(id=game.id).update(
+        vote_count=F('vote_count') + 1)
+
+def vote_count(game_id):
+    '''The game's vote_count as of now, which its version doesn't track.'''
+    return models.Game.objects.filter(id=game_id).values_list(
+        'vote_count', flat=True).first() or 0
+
+def question_advanced(game, round_num, next_question):
+    '''
+    Move `game` from its current question to `next_question` (an id), unless
+    round `round_num` was already closed. Returns whether it did.
+    '''
+    return bump_version(
+        game,
+        only_if={'questions_asked_count': round_num},
+        prev=game.current,
+        current_id=next_question,
+        slot_order=deal_slots(game.num_psych_answers),
+        phase=models.Game.OPEN,
+        answer_count=0,
+        vote_count=0,
+        questions_asked_count=F('questions_asked_count') + 1,
+        )
+
+def _notify(game_id):
+    with _changed:
+        _generations[game_id] = _generations.get(game_id, 0) + 1
+        _changed.notify_all()
+
+def wait_for_change(game_id, seen_etag):
+    '''
+    Hold until the game's state ETag differs from `seen_etag`, or the
+    long-poll timeout passes. Returns (state, retry_after) where
+    retry_after is how many seconds the client should wait before
+    polling again.
+
+    When too many polls are already held in this process the request
+    isn't held at all, and the client is told to back off instead. With
+    a timeout of 0 polls are never held, and the client is told to wait
+    ``PSYKAHUT_POLL_INTERVAL``.
+    '''
+    global _num_waiting
+    with _changed:
+        if _num_waiting >= settings.PSYKAHUT_LONG_POLL_MAX_WAITERS:
+            busy = True
+        else:
+            busy = False
+            _num_waiting += 1
+    if busy:
+        return current_state(game_id), settings.PSYKAHUT_POLL_BACKOFF
+    try:
+        if settings.PSYKAHUT_LONG_POLL_TIMEOUT <= 0:
+            # Not holding polls at all
+            return current_state(game_id), settings.PSYKAHUT_POLL_INTERVAL
+        deadline = time.monotonic() + settings.PSYKAHUT_LONG_POLL_TIMEOUT
+        while True:
+            with _changed:
+                generation = _generations.get(game_id, 0)
+            state = current_state(game_id)
+            remaining = deadline - time.monotonic()
+            if etag(state) != seen_etag or remaining <= 0:
+                return state, 0
+            with _changed:
+                _changed.wait_for(
+                    lambda: _generations.get(game_id, 0) != generation,
+                    min(remaining, settings.PSYKAHUT_LONG_POLL_RECHECK))
+    finally:
+        with _changed:
+            _num_waiting -= 1
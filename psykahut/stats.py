@@ -0,0 +1,109 @@
+"""Per-question statistics, kept up to date as rounds close.
+
+`record_round` adds a closed round to its question's `QuestionStats`,
+from the round's summary, so that no history needs scanning to tell how
+psychable a question is. `backfill` computes them from the history, for
+the rounds closed before they were kept, and `backfill_archived` adds
+the rounds of games archive.py has pruned since.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from . import models
+
+def record_round(question_id, summary):
+    '''
+    Add a closed round, given its summary as built by
+    summaries.build_summary(), to its question's stats.
+    '''
+    real, *fakes = summary['answers']
+    models.QuestionStats.objects.bulk_create(
+        [models.QuestionStats(question_id=question_id)],
+        ignore_conflicts=True)
+    if fakes:
+        models.QuestionFakeAnswer.objects.bulk_create([
+            models.QuestionFakeAnswer(question_id=question_id, normalized=x)
+            for x in {models.normalize_answer(x['text']) for x in fakes}],
+            ignore_conflicts=True)
+    models.QuestionStats.objects.filter(question_id=question_id).update(
+        rounds=F('rounds') + 1,
+        real_votes=F('real_votes') + len(real['votes']['voters']),
+        fake_votes=F('fake_votes') + sum(
+            len(x['votes']['voters']) for x in fakes),
+        fake_answers=Coalesce(Subquery(
+            models.QuestionFakeAnswer.objects.filter(
+                question=OuterRef('question')).values('question').annotate(
+                count=Count('id')).values('count')), 0),
+        )
+
+def backfill(batch_size=500):
+    '''
+    Recompute the stats of all questions from the rounds closed so far,
+    a batch of questions at a time. Yields the number of questions done.
+    Rounds of games already archived are left to `backfill_archived`,
+    to run after.
+    '''
+    last_id = 0
+    while True:
+        ids = list(models.Question.objects.filter(id__gt=last_id).order_by(
+            'id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        last_id = ids[-1]
+        stats = {x: models.QuestionStats(question_id=x) for x in ids}
+        # A game's current question is its only round that isn't closed
+        closed = ~Q(game__current=F('question'))
+        for question, rounds in models.DeckEntry.objects.filter(
+                question__in=ids,
+                position__lt=F('game__questions_asked_count'),
+                ).values_list('question').annotate(Count('id')):
+            stats[question].rounds = rounds
+        for question, real, fake in models.Vote.objects.filter(
+                closed, question__in=ids).values('question').annotate(
+                real=Count('id', filter=Q(answer=None)),
+                fake=Count('id', filter=Q(answer__isnull=False)),
+                ).values_list('question', 'real', 'fake'):
+            stats[question].real_votes = real
+            stats[question].fake_votes = fake
+        fake_answers = [
+            models.QuestionFakeAnswer(question_id=question, normalized=text)
+            for question, text in models.Answer.objects.filter(
+                closed, question__in=ids).values_list(
+                'question', 'normalized').distinct()]
+        for answer in fake_answers:
+            stats[answer.question_id].fake_answers += 1
+        with transaction.atomic():
+            models.QuestionStats.objects.filter(question__in=ids).delete()
+            models.QuestionFakeAnswer.objects.filter(
+                question__in=ids).delete()
+            models.QuestionStats.objects.bulk_create(stats.values())
+            models.QuestionFakeAnswer.objects.bulk_create(
+                fake_answers, batch_size=batch_size)
+        yield len(ids)
+
+def backfill_archived(batch_size=500):
+    '''
+    Add the rounds of archived games to the stats, a batch of games at a
+    time. Yields the number of games done. Archives keep questions by
+    text, so rounds of questions since edited or deleted are skipped.
+    '''
+    last_id = 0
+    while True:
+        archives = list(models.ArchivedGame.objects.filter(
+            id__gt=last_id).order_by('id')[:batch_size])
+        if not archives:
+            return
+        last_id = archives[-1].id
+        for archived in archives:
+            rounds = archived.data['rounds']
+            # Topic names may repeat; take the oldest question
+            ids = dict(models.Question.objects.filter(
+                topic__name=archived.topic,
+                question_text__in=[x['question'] for x in rounds],
+                ).order_by('-id').values_list('question_text', 'id'))
+            with transaction.atomic():
+                for summary in rounds:
+                    if summary['question'] in ids:
+                        record_round(ids[summary['question']], summary)
+        yield len(archives)
@@ -0,0 +1,69 @@
+"""Round summaries: each round's answers, who voted for them, and the scores.
+
+`build_summary` computes one from a round's rows when the round closes,
+where it's stored as a `RoundSummary`. `summary` serves the last closed
+round's from the cache.
+"""
+from django.core.cache import cache
+
+from . import models
+
+def build_summary(game, question, scores=None):
+    answers = models.Answer.objects.filter(
+        question=question, game=game).order_by('id').values_list(
+        'id', 'text', 'author__name')
+    voters = {}
+    for answer_id, name in models.Vote.objects.filter(
+            question=question, game=game).order_by('id').values_list(
+            'answer_id', 'voter__name'):
+        voters.setdefault(answer_id, []).append(name)
+    colors = ['red', 'green', 'blue', 'brown', 'purple']
+    def votes_for(answer_id):
+        cur = voters.get(answer_id, [])
+        score_char = 'ח' if answer_id else '✓'
+        return {
+            'count':
+                ''.join(
+                    '<span style="color:%s">%s</span>' %
+                    (colors[i % len(colors)], score_char)
+                    for i in range(len(cur))),
+            'voters': cur,
+        }
+    if scores is None:
+        scores = models.Player.objects.filter(game=game).order_by(
+            '-score', 'name').values('name', 'score')
+    return {
+        'question': question.question_text,
+        'answers':
+            [{
+                'text': question.answer_text,
+                'author': 'תשובה אמיתית',
+                'votes': votes_for(None),
+            }]
+            +
+            [{
+                'text': text,
+                'author': author,
+                'votes': votes_for(answer_id),
+            } for answer_id, text, author in answers],
+        'scores': list(scores[:5]),
+        }
+
+def summary(game):
+    if not game.prev:
+        return
+    # A closed round's summary never changes, so cache it for good
+    key = f'psykahut:summary:{game.id}:{game.prev_id}'
+    data = cache.get(key)
+    if data is None:
+        data = models.RoundSummary.objects.filter(
+            game=game, question=game.prev).values_list('data', flat=True).first()
+        if data is None:
+            # Round closed before summaries were stored
+            # Another request may have stored it meanwhile, from fresher
+            # rows than a lagging replica has
+            data = models.RoundSummary.objects.get_or_create(
+                game=game, question=game.prev, defaults={
+                    'data': build_summary(game, game.prev)})[0].data
+        cache.set(key, data, None)
+    return data
@@ -1,3 +1,644 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import json
+import os
+import re
+import tempfile
+import threading
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import (
+    archive, events, gamelog, leaderboards, models, profiling, routers,
+    state, views, votes)
+from .management.commands.replay_game import Replay, deck_questions
+
+class GameMixin:
+    def setUp(self):
+        cache.clear()
+        self.topic = models.Topic.objects.create(name='test')
+        for i in range(3):
+            models.Question.objects.create(
+                topic=self.topic, question_text=f'q{i}', answer_text=f'a{i}')
+        self.game = self.start_game(num_answers=2)
+
+    def start_game(self, **options):
+        response = self.client.post('/manage/start_new/', dict(
+            options, topic='test'))
+        return models.Game.objects.get(code=response.url.split('/')[1])
+
+    def url(self, path='', game=None):
+        return f'/{(game or self.game).code}/{path}'
+
+    def join(self, name, game=None):
+        client = self.client_class()
+        client.post('/register/', {
+            'name': name, 'code': (game or self.game).code.lower()})
+        return client
+
+class GameTestCase(GameMixin, TestCase):
+    pass
+
+class GameFlowTest(GameTestCase):
+    def test_round(self):
+        dan, ran = self.join('dan'), self.join('ran')
+        self.assertContains(dan.get(self.url()), 'q0')
+        dan.post(self.url('open_question/'), {'answer': 'fake'})
+        self.assertContains(dan.get(self.url()), 'ממתין לתשובות')
+        ran.post(self.url('open_question/'), {'answer': 'a0'})
+        self.assertContains(ran.get(self.url()), 'q0')
+        ran.post(self.url('open_question/'), {'answer': 'other'})
+        quiz = ran.get(self.url()).context['answers']
+        slot = {x['text']: x['id'] for x in quiz}
+        dan.post(self.url('quiz/'), {'answer': slot['a0']})
+        ran.post(self.url('quiz/'), {'answer': slot['fake']})
+        # Double-click
+        self.client.post(self.url('manage/next/'), {'round': 0})
+        self.client.post(self.url('manage/next/'), {'round': 0})
+        scores = dict(models.Player.objects.values_list('name', 'score'))
+        self.assertEqual(scores, {'dan': 4, 'ran': 0})
+        page = dan.get(self.url())
+        self.assertContains(page, 'q1')
+        self.assertEqual(
+            [x['votes']['voters'] for x in page.context['summary']['answers']],
+            [['dan'], ['ran'], []])
+
+    def test_same_answers(self):
+        dan, ran = self.join('dan'), self.join('ran')
+        dan.post(self.url('open_question/'), {'answer': 'יְרוּשָׁלַיִם'})
+        for answer in ['  ירושלים!', 'A0.']:
+            ran.post(self.url('open_question/'), {'answer': answer})
+        self.assertEqual(self.game.answer_set.count(), 1)
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.answer_count, 1)
+
+    def test_question_stats(self):
+        self.test_round()
+        # The same psych answer again, in another game
+        game = self.start_game()
+        self.join('tal', game).post(
+            self.url('open_question/', game), {'answer': 'Fake!'})
+        self.client.post(self.url('manage/next/', game), {'round': 0})
+        expected = (2, 1, 1, 2)
+        def question_stats():
+            return models.QuestionStats.objects.filter(
+                question__question_text='q0').values_list(
+                'rounds', 'real_votes', 'fake_votes', 'fake_answers').get()
+        self.assertEqual(question_stats(), expected)
+        models.QuestionStats.objects.all().delete()
+        call_command('backfill_question_stats', stderr=io.StringIO())
+        self.assertEqual(question_stats(), expected)
+        self.assertEqual(
+            models.QuestionStats.objects.get(
+                question__question_text='q1').rounds, 0)
+
+    def test_replay(self):
+        self.test_round()
+        events = list(models.GameEvent.objects.filter(
+            game=self.game.id).order_by('id'))
+        self.assertEqual(
+            [x.kind for x in events],
+            ['start', 'register', 'register', 'answer', 'answer', 'vote',
+             'vote', 'next'])
+        self.assertEqual(
+            events[0].data['deck'],
+            list(self.game.deckentry_set.order_by('position').values_list(
+                'question_id', flat=True)))
+        replay = Replay(events, deck_questions(events))
+        for event in events:
+            replay.apply(event)
+        replayed = models.Game.objects.get(code=replay.codes[self.game.id])
+        self.assertEqual(
+            dict(replayed.player_set.values_list('name', 'score')),
+            {'dan': 4, 'ran': 0})
+        self.assertEqual(replayed.current.question_text, 'q1')
+
+    def test_shuffled_deck(self):
+        game = self.start_game(shuffle='on')
+        asked = []
+        for i in range(4):
+            game.refresh_from_db()
+            asked.append(game.current and game.current.question_text)
+            self.client.post(self.url('manage/next/', game), {'round': i})
+        self.assertEqual(sorted(asked[:3]), ['q0', 'q1', 'q2'])
+        self.assertIsNone(asked[3])
+        self.assertEqual(game.questions_asked.count(), 3)
+
+    def test_rooms(self):
+        dan = self.join('dan')
+        other = self.start_game()
+        self.join('ran', other).post(
+            self.url('open_question/', other), {'answer': 'x'})
+        self.assertEqual(other.answer_set.count(), 1)
+        self.assertContains(dan.get(self.url()), 'q0')
+        self.assertContains(dan.get(self.url('', other)), 'name="code"')
+        self.assertEqual(dan.get('/NOSUCH/').status_code, 404)
+
+    def test_shared_pages(self):
+        dan, ran = self.join('dan'), self.join('ran')
+        token = re.compile(r'name="csrfmiddlewaretoken" value="(\w+)"')
+        first = dan.get(self.url()).content.decode()
+        # Rendered once for the round, only the state is looked up
+        with self.assertNumQueries(1):
+            second = ran.get(self.url()).content.decode()
+        self.assertRegex(second, token)
+        self.assertNotIn(views.CSRF_PLACEHOLDER, second)
+        self.assertEqual(token.sub('', first), token.sub('', second))
+
+    def test_player_cookie(self):
+        dan = self.join('dan')
+        ran = self.join('ran')
+        # Only the cookie identifies players, not the session
+        self.assertFalse(dan.session.keys())
+        cookie = dan.cookies['player'].value
+        game_id, player_id = cookie.split(':')[:2]
+        ran.cookies['player'] = cookie.replace(
+            f'{game_id}:{player_id}', f'{game_id}:{int(player_id) + 1}', 1)
+        # A forged cookie isn't accepted
+        self.assertContains(ran.get(self.url()), 'name="code"')
+
+@override_settings(PSYKAHUT_LONG_POLL_TIMEOUT=0)
+class CurQuestionTest(GameTestCase):
+    def test_not_modified_until_state_changes(self):
+        response = self.client.get(self.url('api/cur_question/'))
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(
+            self.url('api/cur_question/'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.join('dan').post(self.url('open_question/'), {'answer': 'x'})
+        response = self.client.get(
+            self.url('api/cur_question/'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_votes_keep_etag(self):
+        dan, ran = self.join('dan'), self.join('ran')
+        dan.post(self.url('open_question/'), {'answer': 'x'})
+        ran.post(self.url('open_question/'), {'answer': 'y'})
+        etag = self.client.get(self.url('api/cur_question/'))['ETag']
+        dan.post(self.url('quiz/'), {'answer': 0})
+        response = self.client.get(
+            self.url('api/cur_question/'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(
+            self.client.get(self.url('manage/')).context['num_votes'], 1)
+        cache.clear()
+        self.assertContains(self.client.get(self.url('spectate/')), '1 הצבעות')
+
+    def test_interval_when_not_held(self):
+        response = self.client.get(self.url('api/cur_question/'))
+        self.assertEqual(response['Retry-After'], '2')
+        response = self.client.get(
+            self.url('api/cur_question/'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Retry-After'], '2')
+
+    @override_settings(PSYKAHUT_LONG_POLL_MAX_WAITERS=0)
+    def test_backoff_when_busy(self):
+        etag = self.client.get(self.url('api/cur_question/'))['ETag']
+        response = self.client.get(
+            self.url('api/cur_question/'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Retry-After'], '5')
+
+class SpectateTest(GameTestCase):
+    def test_spectate(self):
+        dan = self.join('dan')
+        response = self.client.get(self.url('spectate/'))
+        self.assertContains(response, 'q0')
+        self.assertContains(response, '0 תשובות')
+        # Every other viewer is served from the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.client.get(self.url('spectate/')).content,
+                response.content)
+            self.assertEqual(self.client.get(
+                self.url('spectate/'), HTTP_IF_NONE_MATCH=response['ETag'],
+                ).status_code, 304)
+        dan.post(self.url('open_question/'), {'answer': 'fake'})
+        # Seen once the cached version expires
+        cache.clear()
+        self.assertContains(self.client.get(self.url('spectate/')), '1 תשובות')
+        self.assertEqual(self.client.get('/NOSUCH/spectate/').status_code, 404)
+
+class ProfilingTest(GameTestCase):
+    def test_profile_and_report(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(
+                PSYKAHUT_PROFILE_DIR=tmp, PSYKAHUT_PROFILE_RATE=0,
+                PSYKAHUT_PROFILE_SLOW=0):
+            dan = self.join('dan')
+            # Slow, so saved with its SQL, and the next one is profiled
+            response = dan.get(self.url())
+            dan.get(self.url())
+            saved = profiling.load('psykahut.views.index')
+            self.assertEqual(
+                [prof is not None for _, prof in saved['psykahut.views.index']],
+                [False, True])
+            # Counted by the same wrapper as the Server-Timing header
+            info = saved['psykahut.views.index'][0][0]
+            self.assertEqual(len(info['queries']), info['num_queries'])
+            self.assertIn(
+                f'"{info["num_queries"]} queries"', response['Server-Timing'])
+            out = io.StringIO()
+            call_command(
+                'profile_report', view='psykahut.views.index', stdout=out)
+        self.assertIn('psykahut.views.index: 2 requests', out.getvalue())
+        self.assertIn('views.py', out.getvalue())
+        self.assertIn('FROM "psykahut_game"', out.getvalue())
+
+class RecordingBroker(events.InProcessBroker):
+    published = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, json.loads(message)))
+        super().publish(channel, message)
+
+@override_settings(PSYKAHUT_EVENT_BROKER='psykahut.tests.RecordingBroker')
+class EventStreamTest(GameTestCase):
+    def setUp(self):
+        events.get_broker.cache_clear()
+        RecordingBroker.published = []
+        super().setUp()
+
+    def tearDown(self):
+        events.get_broker.cache_clear()
+
+    def test_write_views_publish(self):
+        player = self.join('dan')
+        with self.captureOnCommitCallbacks(execute=True):
+            player.post(self.url('open_question/'), {'answer': 'x'})
+            self.join('ran').post(self.url('open_question/'), {'answer': 'y'})
+            player.post(self.url('quiz/'), {'answer': 0})
+            self.client.post(self.url('manage/next/'))
+        self.assertEqual(
+            [(x['event'], x['is_quiz']) for _, x in RecordingBroker.published],
+            [('open_question', False), ('open_question', True),
+             ('next_question', False)])
+
+    def test_stream(self):
+        async def run():
+            frames = []
+            started = asyncio.Event()
+            disconnect = asyncio.Event()
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+            async def send(message):
+                if message['type'] == 'http.response.body':
+                    frames.append(message['body'].decode())
+                    started.set()
+                    if len(frames) == 2:
+                        disconnect.set()
+            app = events.with_event_stream(None)
+            task = asyncio.ensure_future(app(
+                {'type': 'http', 'path': f'/events/{self.game.id}/'},
+                receive, send))
+            await started.wait()
+            events.get_broker().publish(self.game.id, '{"event": "x"}')
+            await task
+            return frames
+        initial, pushed = async_to_sync(run)()
+        self.assertIn('"cur": %d' % self.game.current_id, initial)
+        self.assertEqual(pushed, 'data: {"event": "x"}\n\n')
+
+@override_settings(PSYKAHUT_VOTE_BUFFER=True, PSYKAHUT_VOTE_FLUSH_SIZE=2)
+class VoteBufferTest(GameTestCase):
+    def test_votes_written_in_batches(self):
+        players = [self.join(name) for name in ['dan', 'ran', 'tal']]
+        for i, player in enumerate(players[:2]):
+            player.post(self.url('open_question/'), {'answer': f'fake {i}'})
+        quiz = players[0].get(self.url()).context['answers']
+        slot = {x['text']: x['id'] for x in quiz}
+        for player in players:
+            player.post(self.url('quiz/'), {'answer': slot['a0']})
+        # Voting again doesn't count
+        players[2].post(self.url('quiz/'), {'answer': slot['fake 0']})
+        self.assertEqual(models.Vote.objects.count(), 2)
+        # A flush that read the ledger before the first one was done
+        game = views.room_round(self.game.code).game
+        cache.delete(f'{votes._prefix(game)}:flushed')
+        votes.flush(game)
+        self.assertContains(players[2].get(self.url()), 'ממתין לתשובות')
+        self.assertEqual(
+            self.client.get(self.url('manage/')).context['num_votes'], 3)
+        self.client.post(self.url('manage/next/'), {'round': 0})
+        # Each vote is logged once
+        self.assertEqual(models.GameEvent.objects.filter(
+            kind=gamelog.VOTE).count(), 3)
+        self.assertEqual(
+            sorted(models.Player.objects.values_list('score', flat=True)),
+            [3, 3, 3])
+
+    def test_nothing_lost_on_close(self):
+        players = [self.join(name) for name in ['dan', 'ran', 'tal', 'gal']]
+        for i, player in enumerate(players[:2]):
+            player.post(self.url('open_question/'), {'answer': f'fake {i}'})
+        round_ = views.room_round(self.game.code)
+        for player in players[:3]:
+            player.post(self.url('quiz/'), {'answer': 0})
+        # As if evicted, or the process died before writing it
+        cache.delete(f'{votes._prefix(round_.game)}:3')
+        self.client.post(self.url('manage/next/'), {'round': 0})
+        self.assertEqual(models.Vote.objects.count(), 3)
+        # A vote still aimed at the closed round
+        gal = models.Player.objects.get(name='gal')
+        self.assertFalse(votes.add(round_.game, gal, 0))
+        self.assertFalse(models.Vote.objects.filter(voter=gal).exists())
+
+class QueryPlanTest(GameTestCase):
+    def assertUsesIndex(self, queryset, *indexes):
+        if connection.vendor == 'postgresql':
+            # Tables this small would otherwise be scanned
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+            self.assertTrue(any(x in plan for x in indexes), plan)
+        else:
+            # SQLite names indexes of table constraints itself
+            self.assertRegex(
+                queryset.explain(), r'SEARCH \w+ USING (COVERING )?INDEX')
+
+    def test_hot_lookups_are_indexed(self):
+        game, question = self.game, self.game.current
+        self.assertUsesIndex(
+            models.Answer.objects.filter(game=game, question=question),
+            'unique_answer_slot', 'unique_answer_author')
+        self.assertUsesIndex(
+            models.Vote.objects.filter(game=game, question=question, voter=1),
+            'unique_vote')
+        self.assertUsesIndex(
+            models.Player.objects.filter(name='dan', game=game),
+            'unique_player_name')
+        self.assertUsesIndex(
+            models.Topic.objects.filter(name='test'), 'psykahut_topic_name')
+
+class QueryBudgetTest(GameTestCase):
+    '''
+    Queries per view in a game with many players, with nothing cached.
+    None of these may grow with the number of players.
+    '''
+    num_players = 200
+    budgets = {
+        'index': 5,
+        'cur_question_id': 4,
+        'manage': 6,
+        'answer_quiz': 9,
+        'next_question': 27,
+        'admin': 6,
+    }
+
+    def setUp(self):
+        super().setUp()
+        game = self.game
+        models.Player.objects.bulk_create([
+            models.Player(name=f'p{i}', game=game)
+            for i in range(self.num_players)])
+        players = list(models.Player.objects.filter(game=game))
+        answers = [
+            models.Answer.objects.create(
+                text=f'fake {i}', normalized=f'fake {i}', author=players[i],
+                permutation_order=slot, game=game, question=game.current)
+            for i, slot in enumerate(game.slot_order[:-1])]
+        models.Vote.objects.bulk_create([
+            models.Vote(
+                voter=player, game=game, question=game.current,
+                answer=(answers + [None])[i % 3])
+            for i, player in enumerate(players)])
+        state.bump_version(
+            game, answer_count=len(answers), vote_count=len(players),
+            phase=models.Game.QUIZ)
+        self.player = self.join('dan')
+
+    def request(self, view, client, method, path, data=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(path, data)
+        self.assertLess(response.status_code, 400)
+        self.assertLessEqual(
+            len(queries), self.budgets[view],
+            '\n'.join(x['sql'] for x in queries))
+        self.assertIn(
+            f'db;desc="{len(queries)} queries"', response['Server-Timing'])
+        return response
+
+    def test_budgets(self):
+        self.request('index', self.player, 'get', self.url())
+        self.request(
+            'cur_question_id', self.player, 'get', self.url('api/cur_question/'))
+        self.request('manage', self.client, 'get', self.url('manage/'))
+        self.request(
+            'answer_quiz', self.player, 'post', self.url('quiz/'), {'answer': 0})
+        self.request(
+            'next_question', self.client, 'post', self.url('manage/next/'),
+            {'round': 0})
+        # Now with the closed round's summary
+        self.request('index', self.player, 'get', self.url())
+        self.request('manage', self.client, 'get', self.url('manage/'))
+
+    @override_settings(
+        STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_admin_changelists(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        for model in ['answer', 'vote', 'player']:
+            path = f'/admin/psykahut/{model}/'
+            self.request('admin', self.client, 'get', path)
+            self.request(
+                'admin', self.client, 'get',
+                f'{path}?game={self.game.id}&question={self.game.current_id}'
+                if model != 'player' else f'{path}?game={self.game.id}')
+
+class ArchiveTest(GameTestCase):
+    def test_compact_games(self):
+        dan, ran = self.join('dan'), self.join('ran')
+        dan.post(self.url('open_question/'), {'answer': 'fake'})
+        ran.post(self.url('open_question/'), {'answer': 'other'})
+        quiz = dan.get(self.url()).context['answers']
+        slot = {x['text']: x['id'] for x in quiz}
+        dan.post(self.url('quiz/'), {'answer': slot['other']})
+        self.client.post(self.url('manage/next/'), {'round': 0})
+        # Still being played, although started as long ago
+        live = self.start_game()
+        week_ago = timezone.now() - datetime.timedelta(days=8)
+        models.Game.objects.update(started=week_ago)
+        models.GameEvent.objects.filter(game=self.game.id).update(time=week_ago)
+        # Closed before summaries were stored
+        models.RoundSummary.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('compact_games', stderr=io.StringIO())
+        self.assertEqual(list(models.Game.objects.all()), [live])
+        self.assertEqual(self.client.post('/register/', {
+            'name': 'tal', 'code': self.game.code}).url, '/')
+        for model in [models.Answer, models.Vote, models.Player]:
+            self.assertFalse(model.objects.exists())
+        archived = models.ArchivedGame.objects.get(code=self.game.code)
+        self.assertEqual(
+            [x['question'] for x in archived.data['rounds']], ['q0'])
+        self.assertEqual(
+            [x['name'] for x in archived.data['scores']], ['ran', 'dan'])
+        self.assertContains(
+            self.client.get(archived.get_absolute_url()), 'fake')
+        # Backfilling keeps the archived rounds
+        call_command('backfill_question_stats', stderr=io.StringIO())
+        self.assertEqual(models.QuestionStats.objects.filter(
+            question__question_text='q0').values_list(
+            'rounds', 'fake_votes', 'fake_answers').get(), (1, 1, 2))
+
+class LeaderboardTest(GameTestCase):
+    def play_round(self, game, answers, votes):
+        players = {name: self.join(name, game) for name in answers}
+        for name, answer in answers.items():
+            players[name].post(
+                self.url('open_question/', game), {'answer': answer})
+        quiz = players[name].get(self.url('', game)).context['answers']
+        slot = {x['text']: x['id'] for x in quiz}
+        for name, answer in votes.items():
+            players[name].post(
+                self.url('quiz/', game), {'answer': slot[answer]})
+        # Totals are added once the round's transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url('manage/next/', game), {'round': 0})
+
+    def test_totals(self):
+        # dan 4, ran 0
+        self.play_round(
+            self.game, {'dan': 'fake', 'ran': 'other'},
+            {'dan': 'a0', 'ran': 'fake'})
+        # dan 0, ran 4
+        other = self.start_game(num_answers=2)
+        self.play_round(
+            other, {'dan': 'x', 'ran': 'y'}, {'dan': 'y', 'ran': 'a0'})
+        expected = [{'name': 'dan', 'score': 4}, {'name': 'ran', 'score': 4}]
+        self.assertEqual(leaderboards.top(leaderboards.ALL_TIME), expected)
+        with self.assertNumQueries(2):
+            page = self.client.get(f'/leaderboard/{self.topic.id}/')
+        self.assertEqual(page.context['scores'], expected)
+        self.assertEqual(
+            leaderboards.top(leaderboards.game_scope(other.id)),
+            [{'name': 'ran', 'score': 4}, {'name': 'dan', 'score': 0}])
+
+@override_settings(PSYKAHUT_REPLICAS=['replica'])
+class ReplicaRouterTest(TestCase):
+    def route(self, request, write=False):
+        router = routers.ReplicaRouter()
+        used = []
+        def get_response(request):
+            if write:
+                router.db_for_write(models.Vote)
+            used.append(router.db_for_read(models.Game))
+            return HttpResponse()
+        response = routers.ReplicaMiddleware(get_response)(request)
+        return used[0], response
+
+    def test_routing(self):
+        factory = RequestFactory()
+        used, response = self.route(factory.get('/'))
+        self.assertEqual(used, 'replica')
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+        # Outside of requests reads use the primary
+        self.assertIsNone(routers.ReplicaRouter().db_for_read(models.Game))
+        self.assertIsNone(self.route(factory.get('/'), write=True)[0])
+        used, response = self.route(factory.post('/'))
+        self.assertIsNone(used)
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        pinned = factory.get('/')
+        pinned.COOKIES[routers.PIN_COOKIE] = '1'
+        self.assertIsNone(self.route(pinned)[0])
+
+class QuestionBankTest(TestCase):
+    def test_import_export(self):
+        models.Question.objects.create(
+            topic=models.Topic.objects.create(name='animals'),
+            question_text='cat', answer_text='meow')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bank.csv')
+            with open(path, 'w', newline='') as f:
+                f.write(
+                    'topic,question_text,answer_text\n'
+                    'animals,cat,purr\n'
+                    'animals,dog,woof\n'
+                    'animals,dog,bark\n'
+                    'food,pizza,yum\n')
+            call_command(
+                'import_questions', path, batch_size=2, stderr=io.StringIO())
+            self.assertEqual(
+                sorted(models.Question.objects.values_list(
+                    'topic__name', 'question_text', 'answer_text')),
+                [('animals', 'cat', 'meow'), ('animals', 'dog', 'woof'),
+                 ('food', 'pizza', 'yum')])
+            exported = os.path.join(tmp, 'bank.jsonl')
+            call_command('export_questions', output=exported, topic=['food'])
+            with open(exported) as f:
+                self.assertEqual(
+                    [json.loads(x) for x in f],
+                    [{'topic': 'food', 'question_text': 'pizza',
+                      'answer_text': 'yum'}])
+            call_command(
+                'import_questions', exported, topic='animals',
+                stderr=io.StringIO())
+        self.assertEqual(
+            models.Question.objects.filter(topic__name='animals').count(), 3)
+
+class LoadTestCommandTest(TransactionTestCase):
+    def test_loadtest(self):
+        topic = models.Topic.objects.create(name='kept')
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'report.json')
+            call_command(
+                'loadtest', players=4, rounds=2, concurrency='1,2',
+                output=output, stderr=io.StringIO())
+            with open(output) as f:
+                report = json.load(f)
+        self.assertEqual([x['concurrency'] for x in report['runs']], [1, 2])
+        for run in report['runs']:
+            self.assertEqual(run['endpoints']['next_question']['count'], 2)
+            self.assertFalse(
+                [x for x, stats in run['endpoints'].items() if stats['errors']])
+        # Played in a scratch database of its own
+        self.assertEqual(list(models.Topic.objects.all()), [topic])
+
+class ArchivedCodeTest(GameMixin, TransactionTestCase):
+    def test_register_after_archive(self):
+        archive.archive_game(self.game.id)
+        # As in a process that still has the code cached
+        cache.set(f'psykahut:code:{self.game.code}', self.game.id)
+        self.assertEqual(self.client.post('/register/', {
+            'name': 'tal', 'code': self.game.code}).url, '/')
+
+class ConcurrentAnswersTest(GameMixin, TransactionTestCase):
+    num_players = 8
+
+    def test_each_slot_taken_once(self):
+        game = self.start_game(num_answers=self.num_players - 2)
+        players = [self.join(f'p{i}', game) for i in range(self.num_players)]
+        start = threading.Barrier(len(players))
+        def submit(i):
+            start.wait()
+            players[i].post(
+                self.url('open_question/', game), {'answer': f'fake {i}'})
+            connection.close()
+        threads = [
+            threading.Thread(target=submit, args=(i,))
+            for i in range(len(players))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        game.refresh_from_db()
+        slots = sorted(models.Answer.objects.filter(
+            game=game, question=game.current).values_list(
+            'permutation_order', flat=True))
+        # Each psych slot used once, leaving the real answer's free
+        self.assertEqual(slots, sorted(game.slot_order[:-1]))
+        self.assertEqual(game.answer_count, game.num_psych_answers)
+        self.assertEqual(game.phase, models.Game.QUIZ)
@@ -1,93 +1,99 @@
 import json
 import random
 
+from django.conf import settings
 from django.db import IntegrityError, transaction
-from django.http import HttpResponse, HttpResponseRedirect
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.http import Http404, HttpResponse, HttpResponseNotModified, HttpResponseRedirect
+from django.middleware.csrf import get_token
 from django.shortcuts import render
+from django.template.loader import render_to_string
 from django.views.decorators.http import require_POST
 
-from . import models
+from . import (
+    events, gamelog, leaderboards, models, snapshot, state, stats, summaries,
+    votes)
 
-def current_game():
-    return models.Game.objects.last()
+def room_round(code):
+    '''The current round of the game whose join code is `code`.'''
+    game_id = state.game_id(code)
+    cur = game_id and snapshot.current_round(game_id)
+    if not cur:
+        raise Http404('No such game')
+    return cur
 
-def cur_answers(game):
-    return models.Answer.objects.filter(game=game, question=game.current)
+PLAYER_COOKIE = 'player'
+PLAYER_SALT = 'psykahut.player'
 
 def get_player(request):
-    try:
-        return models.Player.objects.select_related(
-            'game', 'game__current').get(
-            id=request.session.get('player'))
-    except models.Player.DoesNotExist:
-        return
-
-def summary(game):
-    if not game.prev:
-        return
-    votes = models.Vote.objects.filter(
-        question=game.prev, game=game).select_related('voter')
-    colors = ['red', 'green', 'blue', 'brown', 'purple']
-    def votes_for(answer):
-        cur = [x for x in votes if x.answer == answer]
-        score_char = 'ח' if answer else '✓'
-        return {
-            'count':
-                ''.join(
-                    '<span style="color:%s">%s</span>' %
-                    (colors[i % len(colors)], score_char)
-                    for i in range(len(cur))),
-            'voters': [x.voter.name for x in cur],
-        }
-    answers = models.Answer.objects.filter(
-        question=game.prev, game=game)
-    leading_players = models.Player.objects.filter(game=game).order_by('-score')[:5]
-    return {
-        'question': game.prev.question_text,
-        'answers':
-            [{
-                'text': game.prev.answer_text,
-                'author': 'תשובה אמיתית',
-                'votes': votes_for(None),
-            }]
-            +
-            [{
-                'text': x.text,
-                'author': x.author.name,
-                'votes': votes_for(x),
-            } for x in answers],
-        'scores': leading_players,
-        }
-
-def wait_for_answers(request, game, is_quiz):
-    return render(request, 'wait_for_answers.html', {
+    '''
+    The player named by the request's signed player cookie, as a Player
+    with only id and game_id set, or None. Checking it needs no queries.
+    '''
+    token = request.get_signed_cookie(
+        PLAYER_COOKIE, None, salt=PLAYER_SALT,
+        max_age=settings.PSYKAHUT_PLAYER_TOKEN_AGE)
+    if token is None:
+        return None
+    game_id, player_id = map(int, token.split(':'))
+    return models.Player(id=player_id, game_id=game_id)
+
+def set_player(response, player):
+    response.set_signed_cookie(
+        PLAYER_COOKIE, f'{player.game_id}:{player.id}', salt=PLAYER_SALT,
+        max_age=settings.PSYKAHUT_PLAYER_TOKEN_AGE, httponly=True,
+        samesite='Lax')
+
+def event_stream(game):
+    return settings.PSYKAHUT_EVENT_STREAM and f'/events/{game.id}/'
+
+# Rendered in place of the CSRF token in shared pages, and replaced
+# with the request's own token when serving them
+CSRF_PLACEHOLDER = '__psykahut_csrf_token__'
+
+def shared_page(request, cur, template, get_context):
+    '''
+    Render `template` with `get_context()` once for round `cur`, and
+    serve that to every player, with just their CSRF token filled in.
+    '''
+    page = snapshot.get_page(cur, template, lambda: render_to_string(
+        template, dict(get_context(), csrf_token=CSRF_PLACEHOLDER)))
+    return HttpResponse(page.replace(CSRF_PLACEHOLDER, get_token(request)))
+
+def wait_for_answers(request, cur):
+    game = cur.game
+    return shared_page(request, cur, 'wait_for_answers.html', lambda: {
         'cur': game.current.id,
-        'is_quiz': 'true' if is_quiz else 'false'
+        'is_quiz': 'true' if cur.is_quiz else 'false',
+        'game': game.id,
+        'code': game.code,
+        'events': event_stream(game),
     })
 
-def is_in_quiz(game, answers):
-    return len(answers) >= game.num_psych_answers
+def welcome(request):
+    return render(request, 'welcome.html')
 
-def index(request):
-    game = current_game()
+def index(request, code):
+    cur = room_round(code)
     player = get_player(request)
-    if player is None or player.game != game:
-        return render(request, 'welcome.html')
-    answers = cur_answers(game)
-    if is_in_quiz(game, answers):
-        if models.Vote.objects.filter(
-            voter=player, game=game, question=game.current
-            ).exists():
-            return wait_for_answers(request, game, True)
-        return ask_quiz(request, game, answers)
-    for answer in answers:
-        if answer.author == player:
-            return wait_for_answers(request, game, False)
-    return render(request, 'open_question.html', {
+    if player is None or player.game_id != cur.game.id:
+        return render(request, 'welcome.html', {'code': code})
+    game = cur.game
+    if cur.is_quiz:
+        if votes.has_voted(game, player):
+            return wait_for_answers(request, cur)
+        return ask_quiz(request, cur)
+    for answer in cur.answers:
+        if answer.author_id == player.id:
+            return wait_for_answers(request, cur)
+    return shared_page(request, cur, 'open_question.html', lambda: {
         'question': game.current and game.current.question_text,
-        'summary': summary(game),
+        'summary': summaries.summary(game),
         'cur': game.current and game.current.id,
         'is_quiz': 'false',
+        'game': game.id,
+        'code': game.code,
+        'events': event_stream(game),
     })
 
 def permutation_order_avail(game, answers):
@@ -105,71 +111,105 @@ def quiz_data(game, answers):
         'num_answers': len(ordered_answers),
     }
 
-def ask_quiz(request, game, answers):
-    ordered_answers = [(x.permutation_order, x.text) for x in answers]
-    [real_answer_pos] = permutation_order_avail(game, answers)
-    ordered_answers.append((real_answer_pos, game.current.answer_text))
-    ordered_answers.sort()
-    return render(request, 'quiz.html', quiz_data(game, answers))
+def ask_quiz(request, cur):
+    return shared_page(request, cur, 'quiz.html', lambda: dict(
+        quiz_data(cur.game, cur.answers), code=cur.game.code))
 
 @require_POST
-def answer_quiz(request):
-    answer = int(request.POST['answer'])
-    print(answer)
+def answer_quiz(request, code):
     player = get_player(request)
-    game = current_game()
-    vote, created = models.Vote.objects.get_or_create(voter=player, question=game.current, game=game)
-    if created:
-        for x in cur_answers(player.game):
-            if answer == x.permutation_order:
-                vote.answer = x
-                vote.save()
-                break
-    return HttpResponseRedirect('/')
+    cur = room_round(code)
+    game = cur.game
+    if player is None or player.game_id != game.id:
+        return HttpResponseRedirect(f'/{code}/')
+    slot = int(request.POST['answer'])
+    if not cur.is_quiz or not 0 <= slot <= game.num_psych_answers:
+        return HttpResponseRedirect(f'/{code}/')
+    if settings.PSYKAHUT_VOTE_BUFFER:
+        votes.add(game, player, slot)
+        return HttpResponseRedirect(f'/{code}/')
+    # Any other slot is the real answer's
+    answer = {x.permutation_order: x for x in cur.answers}.get(slot)
+    try:
+        with transaction.atomic():
+            models.Vote.objects.create(
+                voter=player, question=game.current, game=game, answer=answer)
+            gamelog.vote(game.id, player.id, answer and answer.author_id).save()
+            state.vote_added(game)
+    except IntegrityError:
+        # Already voted
+        pass
+    return HttpResponseRedirect(f'/{code}/')
 
 @require_POST
 def register(request):
+    code = request.POST['code'].strip().upper()
     name = request.POST['name']
-    if name:
-        player, created = models.Player.objects.get_or_create(
-            name=name, game=current_game())
-        request.session["player"] = player.id
-    return HttpResponseRedirect('/')
-
-@require_POST
-def open_question(request):
-    answer = request.POST['answer']
-    player = get_player(request)
-    if answer == player.game.current.answer_text:
+    game_id = state.game_id(code)
+    if game_id is None:
         return HttpResponseRedirect('/')
-    while True:
+    response = HttpResponseRedirect(f'/{code}/')
+    if name:
         try:
             with transaction.atomic():
-                answers = cur_answers(player.game)
-                for x in answers:
-                    if answer == x.text:
-                        return HttpResponseRedirect('/')
-                if len(answers) < player.game.num_psych_answers:
-                    perm_avail = permutation_order_avail(player.game, answers)
-                    answer, created = models.Answer.objects.get_or_create(
-                        text=answer, author=player,
-                        permutation_order=random.choice(perm_avail),
-                        game=player.game, question=player.game.current)
+                player = models.Player.objects.create(name=name, game_id=game_id)
+                gamelog.record(
+                    game_id, gamelog.REGISTER, player=player.id, name=name)
         except IntegrityError:
-            raise
-        break
-    return HttpResponseRedirect('/')
+            # Rejoining
+            player = models.Player.objects.filter(
+                name=name, game_id=game_id).first()
+            if player is None:
+                # The game was archived, and another process still had
+                # its code cached
+                return HttpResponseRedirect('/')
+        set_player(response, player)
+    return response
+
+@require_POST
+def open_question(request, code):
+    answer = request.POST['answer'].strip()
+    normalized = models.normalize_answer(answer)
+    player = get_player(request)
+    game = room_round(code).game
+    if (player is None or player.game_id != game.id or
+            game.current is None or not normalized or
+            normalized == models.normalize_answer(game.current.answer_text)):
+        return HttpResponseRedirect(f'/{code}/')
+    try:
+        with transaction.atomic():
+            # Claim first, so the transaction starts by taking the lock
+            # it needs anyway instead of upgrading to it after reading.
+            claimed = state.claim_slot(game)
+            if claimed is None:
+                return HttpResponseRedirect(f'/{code}/')
+            answer_count, slot = claimed
+            models.Answer.objects.create(
+                text=answer, normalized=normalized, author=player,
+                permutation_order=slot, game=game, question=game.current)
+            gamelog.record(
+                game.id, gamelog.ANSWER, player=player.id, answer=answer)
+            events.publish(
+                game, 'open_question',
+                is_quiz=answer_count >= game.num_psych_answers)
+    except IntegrityError:
+        # The player already answered, or someone gave the same answer.
+        # Leaving the block rolled back the claim.
+        pass
+    return HttpResponseRedirect(f'/{code}/')
 
-def manage(request):
-    game = current_game()
-    answers = cur_answers(game)
+def manage(request, code=None):
+    if code is None:
+        return render(request, 'manage_game.html')
+    cur = room_round(code)
+    game = cur.game
     return render(request, 'manage_game.html', {
         'game': game,
-        'answers': quiz_data(game, answers) if is_in_quiz(game, answers) else None,
-        'num_questions_asked': len(game.questions_asked.all()),
-        'num_answers': len(models.Answer.objects.filter(game=game, question=game.current)),
-        'num_votes': len(models.Vote.objects.filter(game=game, question=game.current)),
-        'summary': summary(game),
+        'answers': quiz_data(game, cur.answers) if cur.is_quiz else None,
+        'num_questions_asked': game.questions_asked_count,
+        'num_answers': game.answer_count,
+        'num_votes': votes.count(game),
+        'summary': summaries.summary(game),
     })
 
 @require_POST
@@ -178,55 +218,182 @@ def start_new(request):
         topic = models.Topic.objects.get(name=request.POST['topic'])
     except models.Topic.DoesNotExist:
         return HttpResponseRedirect('/manage/')
+    deck = list(models.Question.objects.filter(topic=topic).order_by(
+        'id').values_list('id', flat=True))
+    if not deck:
+        return HttpResponseRedirect('/manage/')
     game = models.Game(topic=topic)
     game.shuffle = 'shuffle' in request.POST
-    questions = models.Question.objects.filter(topic=game.topic)
-    game.current = random.choice(questions) if game.shuffle else questions[0]
+    if game.shuffle:
+        random.shuffle(deck)
+    game.current_id = deck[0]
     num_answers = request.POST.get('num_answers')
     if num_answers:
-        game.num_psych_answers = num_answers
-    game.save()
-    return HttpResponseRedirect('/manage/')
+        game.num_psych_answers = int(num_answers)
+    game.slot_order = state.deal_slots(game.num_psych_answers)
+    # The game is only joinable along with its deck and start event
+    with transaction.atomic():
+        while True:
+            # Codes of archived games aren't given out again either
+            if not models.ArchivedGame.objects.filter(code=game.code).exists():
+                try:
+                    with transaction.atomic():
+                        game.save()
+                    break
+                except IntegrityError:
+                    pass
+            # Join code taken
+            game.code = models.random_code()
+        models.DeckEntry.objects.bulk_create([
+            models.DeckEntry(game=game, position=position, question_id=question)
+            for position, question in enumerate(deck)], batch_size=500)
+        gamelog.record(
+            game.id, gamelog.START, code=game.code, topic=topic.name,
+            num_answers=game.num_psych_answers,
+            deck=deck)
+    return HttpResponseRedirect(f'/{game.code}/manage/')
 
-@require_POST
-def next_question(request):
-    game = current_game()
-    score_updates = {}
-    for vote in models.Vote.objects.filter(question=game.current, game=game):
-        if vote.answer is None:
+def spectate(request, code):
+    '''
+    The game as seen on a projector or by an audience: the question, the
+    answer and vote counts, the options and the last round's results.
+    Served from the cache, rendered once per state version and vote count.
+    '''
+    game_id = state.game_id(code)
+    recent = game_id and snapshot.recent_state(game_id)
+    if not recent:
+        raise Http404('No such game')
+    _, version, vote_count = recent
+    cur = snapshot.get_round(game_id, version)
+    game = cur.game
+    # Votes don't bump the version, so they're part of the page's key
+    num_votes = votes.count(game, vote_count)
+    tag = '"%d.%d.%d"' % (game_id, version, num_votes)
+    if request.META.get('HTTP_IF_NONE_MATCH') == tag:
+        response = HttpResponseNotModified()
+    else:
+        def render():
+            return render_to_string('spectate.html', {
+                'game': game,
+                'answers': quiz_data(game, cur.answers) if cur.is_quiz else None,
+                'num_answers': game.answer_count,
+                'num_votes': num_votes,
+                'summary': summaries.summary(game),
+                'etag': tag,
+                'refresh': settings.PSYKAHUT_SPECTATOR_REFRESH,
+            })
+        response = HttpResponse(
+            snapshot.get_page(cur, f'spectate:{num_votes}', render))
+    response['ETag'] = tag
+    # Lets proxies in front share it between viewers as well
+    response['Cache-Control'] = (
+        f'public, max-age={settings.PSYKAHUT_SPECTATOR_REFRESH}')
+    return response
+
+def archived_game(request, code):
+    try:
+        archived = models.ArchivedGame.objects.get(code=code)
+    except models.ArchivedGame.DoesNotExist:
+        raise Http404('No such game')
+    return render(request, 'archived_game.html', {
+        'game': archived,
+        'rounds': archived.data['rounds'],
+        'scores': archived.data['scores'],
+    })
+
+def leaderboard(request, topic_id=None):
+    if topic_id is None:
+        scope, title = leaderboards.ALL_TIME, None
+    else:
+        scope = leaderboards.topic_scope(topic_id)
+        title = models.Topic.objects.filter(id=topic_id).values_list(
+            'name', flat=True).first()
+        if title is None:
+            raise Http404('No such topic')
+    return render(request, 'leaderboard.html', {
+        'title': title,
+        'scores': leaderboards.top(scope),
+    })
+
+def score_votes(game, question):
+    '''
+    Apply the scores for the votes on `question`, computed by the
+    database in one aggregated query and applied in one update.
+    Returns {player id: score delta}.
+    '''
+    own_answer = Q(answer__author=F('voter'))
+    deltas = dict(models.Vote.objects.filter(
+        game=game, question=question,
+        ).annotate(
+        who=Case(
+            When(answer=None, then=F('voter')),
+            When(own_answer, then=F('voter')),
+            default=F('answer__author')),
+        delta=Case(
             # Correct answer
-            who = vote.voter
-            delta = 3
-        elif vote.voter == vote.answer.author:
-            who = vote.voter
-            delta = -3
-        else:
-            who = vote.answer.author
-            delta = 1
-        score_updates.setdefault(who.id, []).append(delta)
-    with transaction.atomic():
-        for who, deltas in score_updates.items():
-            player = models.Player.objects.get(id=who)
-            player.score += sum(deltas)
-            player.save()
-
-    asked = set(game.questions_asked.all())
-    asked.add(game.current)
-    questions_pool = [
-        x for x in models.Question.objects.filter(topic=game.topic).all()
-        if x not in asked]
+            When(answer=None, then=Value(3)),
+            When(own_answer, then=Value(-3)),
+            default=Value(1)),
+        ).values_list('who').annotate(Sum('delta')))
+    by_delta = {}
+    for who, delta in deltas.items():
+        by_delta.setdefault(delta, []).append(who)
+    if by_delta:
+        models.Player.objects.filter(id__in=deltas).update(score=F('score') + Case(
+            *[When(id__in=ids, then=Value(delta)) for delta, ids in by_delta.items()],
+            default=Value(0)))
+    return deltas
+
+@require_POST
+def next_question(request, code):
+    game = room_round(code).game
+    if game.current is None:
+        return HttpResponseRedirect(f'/{code}/manage/')
+    # The round the host saw, so that a double-click doesn't advance twice
+    round_num = int(request.POST.get('round', game.questions_asked_count))
+    new_current = models.DeckEntry.objects.filter(
+        game=game, position=round_num + 1).values_list(
+        'question_id', flat=True).first()
     with transaction.atomic():
-        game.questions_asked.add(game.current)
+        if not state.question_advanced(game, round_num, new_current):
+            return HttpResponseRedirect(f'/{code}/manage/')
+        # Having claimed the close, so that no more votes are buffered
+        votes.close(game)
+        gamelog.record(game.id, gamelog.NEXT, round=round_num)
+        scores = leaderboards.record(game, score_votes(game, game.current))
+        data = summaries.build_summary(game, game.current, scores)
+        models.RoundSummary.objects.create(
+            game=game, question=game.current, data=data)
+        stats.record_round(game.current_id, data)
         game.prev = game.current
-        game.current = (random.choice(questions_pool) if game.shuffle else questions_pool[0]) if questions_pool else None
-        game.save()
-    return HttpResponseRedirect('/manage/')
+        game.current_id = new_current
+        events.publish(game, 'next_question')
+    return HttpResponseRedirect(f'/{code}/manage/')
 
-def cur_question_id(request):
-    game = current_game()
-    if game.current is None:
-        return HttpResponse('null', content_type="application/json")
-    return HttpResponse(json.dumps({
-        'cur': game.current.id,
-        'is_quiz': is_in_quiz(game, cur_answers(game)),
-    }), content_type="application/json")
+def cur_question_id(request, code):
+    game_id = state.game_id(code)
+    if game_id is None:
+        raise Http404('No such game')
+    seen = request.META.get('HTTP_IF_NONE_MATCH')
+    if seen:
+        cur_state, retry_after = state.wait_for_change(game_id, seen)
+    else:
+        cur_state = state.current_state(game_id)
+        # Its next poll, with the ETag, is held if polls are held at all
+        retry_after = (
+            0 if settings.PSYKAHUT_LONG_POLL_TIMEOUT > 0
+            else settings.PSYKAHUT_POLL_INTERVAL)
+    if state.etag(cur_state) == seen:
+        response = HttpResponseNotModified()
+    elif cur_state is None:
+        response = HttpResponse('null', content_type="application/json")
+    else:
+        cur = snapshot.get_round(*cur_state)
+        response = HttpResponse(json.dumps(cur.game.current and {
+            'cur': cur.game.current.id,
+            'is_quiz': cur.is_quiz,
+        }), content_type="application/json")
+    response['ETag'] = state.etag(cur_state)
+    response['Retry-After'] = retry_after
+    response['Cache-Control'] = 'no-cache'
+    return response
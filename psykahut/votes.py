@@ -0,0 +1,162 @@
+"""Buffered votes.
+
+With ``PSYKAHUT_VOTE_BUFFER`` on, `answer_quiz` doesn't write votes to
+the database. It records them in a per-round ledger in the cache, and
+`flush` writes them with one bulk insert every
+``PSYKAHUT_VOTE_FLUSH_SIZE`` votes. When the round closes, `close`
+writes all the rest.
+
+The ledger must be seen by all worker processes and kept for the whole
+round, so this needs a shared cache such as memcached with room to
+spare, rather than the default per-process LocMemCache.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import gamelog, models, state
+
+# Added to a round's vote count when it closes, so later votes are
+# recognized by the count they get
+CLOSED = 10 ** 9
+
+# How long a flush may hold a round's ledger before others may take it
+FLUSH_LOCK_TTL = 10
+
+def _prefix(game):
+    return f'psykahut:votes:{game.id}:{game.questions_asked_count}'
+
+def add(game, player, slot):
+    '''
+    Record the player's vote for permutation slot `slot` in the game's
+    current round. Returns False if they had already voted, or the round
+    has closed.
+    '''
+    prefix = _prefix(game)
+    timeout = settings.PSYKAHUT_VOTE_BUFFER_TTL
+    ballot_key = f'{prefix}:voter:{player.id}'
+    if not cache.add(ballot_key, (slot, time.time()), timeout):
+        return False
+    # The ballot is stored before the vote is counted, so that `close`
+    # finds every ballot counted before it
+    cache.add(f'{prefix}:count', 0, timeout)
+    num_votes = cache.incr(f'{prefix}:count')
+    if num_votes > CLOSED:
+        cache.delete(ballot_key)
+        return False
+    cache.set(f'{prefix}:{num_votes}', player.id, timeout)
+    if num_votes % settings.PSYKAHUT_VOTE_FLUSH_SIZE == 0:
+        flush(game)
+    return True
+
+def has_voted(game, player):
+    if (settings.PSYKAHUT_VOTE_BUFFER and
+            cache.get(f'{_prefix(game)}:voter:{player.id}') is not None):
+        return True
+    return models.Vote.objects.filter(
+        voter=player, game=game, question=game.current).exists()
+
+def count(game, vote_count=None):
+    '''
+    The number of votes in the current round, including unflushed ones.
+    `vote_count` is the game's vote_count, if already read.
+    '''
+    if vote_count is None:
+        vote_count = state.vote_count(game.id)
+    if not settings.PSYKAHUT_VOTE_BUFFER:
+        return vote_count
+    prefix = _prefix(game)
+    num_votes = (cache.get(f'{prefix}:count') or 0) % CLOSED
+    flushed = cache.get(f'{prefix}:flushed') or 0
+    return vote_count + max(num_votes - flushed, 0)
+
+def flush(game):
+    '''
+    Write the votes recorded so far in the game's current round. Votes
+    still being recorded, or whose place in the ledger was lost, are
+    left for `close`.
+    '''
+    if not settings.PSYKAHUT_VOTE_BUFFER:
+        return
+    prefix = _prefix(game)
+    num_votes = cache.get(f'{prefix}:count') or 0
+    flushed = cache.get(f'{prefix}:flushed') or 0
+    if num_votes > CLOSED or num_votes <= flushed:
+        return
+    # Another flush is writing these, or the round is closing
+    if not cache.add(f'{prefix}:flushing', True, FLUSH_LOCK_TTL):
+        return
+    try:
+        voters = cache.get_many(
+            [f'{prefix}:{i}' for i in range(flushed + 1, num_votes + 1)])
+        with transaction.atomic():
+            _write(game, cache.get_many(
+                [f'{prefix}:voter:{x}' for x in voters.values()]))
+            # Unless the round has closed meanwhile
+            models.Game.objects.filter(
+                id=game.id, questions_asked_count=game.questions_asked_count,
+                ).update(vote_count=models.Vote.objects.filter(
+                    game=game, question=game.current).count())
+        cache.set(
+            f'{prefix}:flushed', num_votes, settings.PSYKAHUT_VOTE_BUFFER_TTL)
+    finally:
+        cache.delete(f'{prefix}:flushing')
+
+def close(game):
+    '''
+    Write all of the votes of the game's current round, and reject any
+    recorded after. Call once the round's close is claimed
+    (state.question_advanced), in the same transaction.
+    '''
+    if not settings.PSYKAHUT_VOTE_BUFFER:
+        return
+    prefix = _prefix(game)
+    cache.add(f'{prefix}:count', 0, settings.PSYKAHUT_VOTE_BUFFER_TTL)
+    cache.incr(f'{prefix}:count', CLOSED)
+    # Wait out a flush writing the round, then keep others out until
+    # this transaction commits. If it rolls back, the lock just expires.
+    deadline = time.monotonic() + FLUSH_LOCK_TTL
+    while (not cache.add(f'{prefix}:flushing', True, FLUSH_LOCK_TTL) and
+            time.monotonic() < deadline):
+        time.sleep(0.05)
+    transaction.on_commit(lambda: cache.delete(f'{prefix}:flushing'))
+    # Look ballots up by player rather than through the ledger, which
+    # may have gaps where keys were evicted
+    _write(game, cache.get_many([
+        f'{prefix}:voter:{x}' for x in models.Player.objects.filter(
+            game=game).values_list('id', flat=True)]))
+
+def _write(game, ballots):
+    '''
+    Write the votes of `ballots`, by their ballot keys, skipping voters
+    whose vote is already written.
+    '''
+    written = set(models.Vote.objects.filter(
+        game=game, question=game.current).values_list('voter_id', flat=True))
+    ballots = {
+        key: ballot for key, ballot in ballots.items()
+        if int(key.rsplit(':', 1)[1]) not in written}
+    if not ballots:
+        return
+    answers = {
+        slot: (answer_id, author_id)
+        for slot, answer_id, author_id in models.Answer.objects.filter(
+            game=game, question=game.current).values_list(
+            'permutation_order', 'id', 'author_id')}
+    new_votes = []
+    logged = []
+    for key, (slot, voted_at) in ballots.items():
+        voter = int(key.rsplit(':', 1)[1])
+        # Any other slot is the real answer's
+        answer_id, author_id = answers.get(slot, (None, None))
+        new_votes.append(models.Vote(
+            voter_id=voter, game=game, question=game.current,
+            answer_id=answer_id))
+        logged.append(gamelog.vote(
+            game.id, voter, author_id, datetime.datetime.fromtimestamp(
+                voted_at, datetime.timezone.utc)))
+    models.Vote.objects.bulk_create(new_votes, ignore_conflicts=True)
+    models.GameEvent.objects.bulk_create(logged)